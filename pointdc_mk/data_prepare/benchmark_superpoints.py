@@ -0,0 +1,69 @@
+import numpy as np
+import os
+os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
+from os.path import join, dirname, abspath
+import sys, glob, time
+import argparse
+
+BASE_DIR = dirname(abspath(__file__))
+ROOT_DIR = dirname(BASE_DIR)
+sys.path.append(BASE_DIR)
+sys.path.append(ROOT_DIR)
+from lib.helper_ply import read_ply
+from lib.superpoint_utils import superpoint_majority
+from lib.supervoxel import initial_superpoints, BACKENDS
+import MinkowskiEngine as ME
+from pathlib import Path
+
+parser = argparse.ArgumentParser(description='speed and parity of the initial superpoint backends on the same scenes')
+parser.add_argument('--input_path', type=str, default='data/S3DIS/processed', help='processed ply path')
+parser.add_argument('--num_scenes', type=int, default=5, help='how many scenes are compared')
+parser.add_argument('--backends', type=str, nargs='+', default=BACKENDS, choices=BACKENDS, help='first one is the reference')
+parser.add_argument('--voxel_size', type=float, default=0.05)
+parser.add_argument('--pcl_threads', type=int, default=2)
+args = parser.parse_args()
+
+args.input_path = join(ROOT_DIR, args.input_path)
+
+
+def purity(sp_labels, labels):
+    """Fraction of the points in a superpoint carrying the majority label of their superpoint"""
+    valid = sp_labels != -1
+    if not valid.any():
+        return 0.
+    return (superpoint_majority(sp_labels, labels) == labels)[valid].mean()
+
+
+def voxelize(path):
+    data = read_ply(path)
+    coords = np.vstack((data['x'], data['y'], data['z'])).T.astype(np.float32)
+    feats = np.vstack((data['red'], data['green'], data['blue'])).T.copy()
+    coords = np.floor((coords - coords.mean(0)) / args.voxel_size)
+    coords, feats, labels = ME.utils.sparse_quantize(np.ascontiguousarray(coords), feats,
+                                                     labels=data['class'].copy(), ignore_label=-1)
+    return coords.numpy().astype(np.float32), feats, labels
+
+
+if __name__ == '__main__':
+    path_list = sorted(glob.glob(args.input_path + '/*.ply'))[:args.num_scenes]
+    reference = args.backends[0]
+    rows = []
+    for path in path_list:
+        coords, feats, labels = voxelize(path)
+        sp = {}
+        for backend in args.backends:
+            start = time.time()
+            sp[backend] = initial_superpoints(coords, feats, backend=backend, num_threads=args.pcl_threads)
+            elapsed = time.time() - start
+            both = (sp[backend] != -1) & (sp[reference] != -1)
+            # how well the reference superpoints are recovered, the purity of this backend w.r.t. the reference
+            parity = purity(sp[backend][both], sp[reference][both])
+            rows.append((backend, elapsed, sp[backend].max() + 1, (sp[backend] == -1).mean(), purity(sp[backend], labels), parity))
+            print('{} {:>6}: {:7.2f}s for {} voxels, {:5d} superpoints, {:.2%} unassigned, purity {:.2%}, parity {:.2%}'.format(
+                Path(path).name, backend, elapsed, coords.shape[0], *rows[-1][2:]))
+
+    print('mean over {} scenes'.format(len(path_list)))
+    for backend in args.backends:
+        stats = np.array([row[1:] for row in rows if row[0] == backend], dtype=np.float64)
+        print('{:>6}: {:7.2f}s, {:7.1f} superpoints, {:.2%} unassigned, purity {:.2%}, parity with {} {:.2%}'.format(
+            backend, *stats.mean(0)[:4], reference, stats.mean(0)[4]))
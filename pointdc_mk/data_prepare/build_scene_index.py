@@ -0,0 +1,78 @@
+import numpy as np
+from os.path import join, dirname, abspath, exists, relpath
+import sys, glob
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+BASE_DIR = dirname(abspath(__file__))
+ROOT_DIR = dirname(BASE_DIR)
+sys.path.append(BASE_DIR)
+sys.path.append(ROOT_DIR)
+from lib.scene_store import read_scene
+from lib.scene_index import INDEX_FILE, SceneIndex, save_scene_index, voxel_tag, clip_mask, scene_key
+from lib.voxel_cache import quantize
+from tqdm import tqdm
+
+parser = argparse.ArgumentParser(description='gather point / voxel / superpoint counts and bounding boxes of the scenes into one index')
+parser.add_argument('--input_path', type=str, default='data/ScanNet/train', help='processed ply path, searched recursively')
+parser.add_argument('--sp_path', type=str, default=None, help='superpoint path, <sp_path>/<name>_superpoint.npy')
+parser.add_argument('--output', type=str, default=None, help='index file, <input_path>/' + INDEX_FILE + ' by default')
+parser.add_argument('--voxel_sizes', type=float, nargs='+', default=[0.02], help='voxel sizes the voxels are counted at')
+parser.add_argument('--clip_bound', type=float, default=None, help='also count the voxels left by S3DIS clipping, 4 for S3DIS')
+parser.add_argument('--r_crop', type=float, default=None, help='also count the voxels left by KITTI cropping')
+parser.add_argument('--workers', type=int, default=8, help='how many processes')
+args = parser.parse_args()
+
+args.input_path = join(ROOT_DIR, args.input_path)
+args.sp_path = None if args.sp_path is None else join(ROOT_DIR, args.sp_path)
+args.output = join(args.input_path, INDEX_FILE) if args.output is None else join(ROOT_DIR, args.output)
+
+
+def scene_facts(path):
+    coords = read_scene(path, fields=['coords'])[0]
+    name = relpath(path, args.input_path)[:-4]
+    facts = {'points': len(coords), 'bbox_min': coords.min(0), 'bbox_max': coords.max(0)}
+    # the datasets voxelize the scenes centered on their mean
+    coords = coords - coords.mean(0)
+
+    if args.sp_path is not None:
+        sp_file = join(args.sp_path, name + '_superpoint.npy')
+        facts['superpoints'] = -1
+        if exists(sp_file):
+            sp_labels = np.load(sp_file, mmap_mode='r')
+            facts['superpoints'] = len(np.unique(sp_labels[sp_labels != -1]))
+
+    for voxel_size in args.voxel_sizes:
+        voxels = quantize(coords, voxel_size)['coords']
+        facts[voxel_tag(voxel_size)] = len(voxels)
+        if args.clip_bound is not None:
+            mask = clip_mask(coords, args.clip_bound)
+            clipped = coords if mask is None else coords[mask]
+            facts[voxel_tag(voxel_size, clip_bound=args.clip_bound)] = len(quantize(clipped, voxel_size)['coords'])
+        if args.r_crop is not None:
+            voxels = voxels.astype(np.float32)
+            facts[voxel_tag(voxel_size, r_crop=args.r_crop)] = int((np.sqrt(((voxels * voxel_size) ** 2).sum(-1)) < args.r_crop).sum())
+    return name, facts
+
+
+if __name__ == '__main__':
+    path_list = sorted(glob.glob(join(args.input_path, '**', '*.ply'), recursive=True))
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        results = list(tqdm(pool.map(scene_facts, path_list, chunksize=4), total=len(path_list)))
+
+    names = np.array([scene_key(name) for name, _ in results])
+    columns = {'names': names}
+    # columns of other voxel sizes / clips of an index of the same scenes are kept
+    if exists(args.output):
+        previous = SceneIndex(args.output)
+        if list(previous.columns['names']) == list(names):
+            columns.update(previous.columns)
+    for key in results[0][1] if results else []:
+        columns[key] = np.array([facts[key] for _, facts in results],
+                                dtype=np.float32 if key.startswith('bbox') else np.int64)
+    save_scene_index(args.output, columns)
+
+    print('indexed {} scenes into {}'.format(len(names), args.output))
+    for key in sorted(k for k in columns if k.startswith('voxels') or k == 'points'):
+        if len(names):
+            print('{:>24}: min {:9d}, median {:9.0f}, max {:9d}'.format(key, columns[key].min(), np.median(columns[key]), columns[key].max()))
@@ -0,0 +1,52 @@
+from os.path import join, dirname, abspath, getsize, basename
+import os, sys, glob
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+BASE_DIR = dirname(abspath(__file__))
+ROOT_DIR = dirname(BASE_DIR)
+sys.path.append(BASE_DIR)
+sys.path.append(ROOT_DIR)
+from lib.scene_store import convert_ply, ply_attributes
+from lib.scene_container import write_container
+from tqdm import tqdm
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--input_path', type=str, default='data/ScanNet/train', help='processed ply path')
+parser.add_argument('--sp_path', type=str, default=None, help='superpoint path, stored in the scene when given')
+parser.add_argument('--format', type=str, default='store', choices=['store', 'container'], \
+                    help='store: one .npy per attribute, container: compressed blocks with a spatial index')
+parser.add_argument('--block_size', type=int, default=65536, help='points per block of a container')
+parser.add_argument('--codec', type=str, default='zlib', choices=['zlib', 'lzma'], help='codec of a container')
+parser.add_argument('--workers', type=int, default=16, help='how many processes')
+args = parser.parse_args()
+
+args.input_path = join(ROOT_DIR, args.input_path)
+if args.sp_path is not None:
+    args.sp_path = join(ROOT_DIR, args.sp_path)
+
+
+def store_size(store):
+    if not os.path.isdir(store):
+        return getsize(store)
+    return sum(getsize(join(store, f)) for f in os.listdir(store))
+
+def handle_process(path):
+    sp_file = None
+    if args.sp_path is not None:
+        sp_file = join(args.sp_path, basename(path)[:-4] + '_superpoint.npy')
+    if args.format == 'container':
+        store = write_container(path, block_size=args.block_size, codec=args.codec, **ply_attributes(path, sp_file))
+    else:
+        store = convert_ply(path, sp_file)
+    return getsize(path), store_size(store)
+
+
+if __name__ == '__main__':
+    print('start converting scenes')
+    path_list = sorted(glob.glob(join(args.input_path, '*.ply')))
+    pool = ProcessPoolExecutor(max_workers=args.workers)
+    result = list(tqdm(pool.map(handle_process, path_list), total=len(path_list)))
+    ply_bytes, store_bytes = sum(r[0] for r in result), sum(r[1] for r in result)
+    print('converted {} scenes: {:.2f} GB of ply -> {:.2f} GB of scene {}'.format(
+        len(result), ply_bytes / 1024**3, store_bytes / 1024**3, args.format))
@@ -5,16 +5,19 @@ import pandas as pd
 import os, sys, glob
 import argparse
 from tqdm import tqdm
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 BASE_DIR = dirname(abspath(__file__))
 ROOT_DIR = dirname(BASE_DIR)
 sys.path.append(BASE_DIR)
 sys.path.append(ROOT_DIR)
 from lib.helper_ply import write_ply
+from lib.manifest import load_manifest, save_manifest, file_signature
 
 parser = argparse.ArgumentParser()
 parser.add_argument('--data_path', type=str, default='data/Stanford3dDataset_v1.2', help='raw data path')
 parser.add_argument('--processed_data_path', type=str, default='data/S3DIS/processed')
+parser.add_argument('--workers', type=int, default=os.cpu_count(), help='how many rooms are converted in parallel')
 args = parser.parse_args()
 
 args.data_path = join(ROOT_DIR, args.data_path)
@@ -30,17 +33,31 @@ sub_grid_size = 0.010
 if not exists(args.processed_data_path):
     os.makedirs(args.processed_data_path)
 out_format = '.ply'
+manifest_file = join(args.processed_data_path, 'manifest.json')
+tmp_path = join(args.processed_data_path, '.tmp')
+
+def read_annotation(f):
+    '''Parse a whitespace separated annotation file in one numpy call, pandas is kept for malformed files'''
+    with open(f, 'rb') as fid:
+        raw = fid.read()
+    num_lines = raw.count(b'\n') + (len(raw) > 0 and not raw.endswith(b'\n'))
+    try:
+        pc = np.fromstring(raw, dtype=np.float64, sep=' ')
+    except ValueError:
+        pc = None
+    if pc is None or pc.shape[0] != num_lines * 6:
+        return pd.read_csv(f, header=None, delim_whitespace=True).values
+    return pc.reshape(num_lines, 6)
 
 def convert_pc2ply(anno_path, file_name):
     sub_ply_file = join(args.processed_data_path, file_name)
-    if os.path.exists(sub_ply_file): return
     data_list = []
 
     for f in glob.glob(join(anno_path, '*.txt')):
         class_name = os.path.basename(f).split('_')[0]
         if class_name not in gt_class:  # note: in some room there is 'staris' class..
             class_name = 'clutter'
-        pc = pd.read_csv(f, header=None, delim_whitespace=True).values
+        pc = read_annotation(f)
         labels = np.ones((pc.shape[0], 1)) * gt_class2label[class_name]
         data_list.append(np.concatenate([pc, labels], 1))
 
@@ -53,14 +70,38 @@ def convert_pc2ply(anno_path, file_name):
     _, _, collabels, inds = ME.utils.sparse_quantize(np.ascontiguousarray(coords), colors, labels, return_index=True, ignore_label=-1, quantization_size=sub_grid_size)
     sub_coords, sub_colors, sub_labels = coords[inds], colors[inds], collabels
 
-    write_ply(sub_ply_file, [sub_coords, sub_colors, sub_labels[:,None]], ['x', 'y', 'z', 'red', 'green', 'blue', 'class'])
+    # Written aside then moved, a killed run never leaves a partial room behind
+    write_ply(join(tmp_path, file_name), [sub_coords, sub_colors, sub_labels[:,None]], ['x', 'y', 'z', 'red', 'green', 'blue', 'class'])
+    os.replace(join(tmp_path, file_name), sub_ply_file)
 
-print('start preprocess')
-# Note: there is an extra character in the v1.2 data in Area_5/hallway_6. It's fixed manually.
-anno_paths_bar = tqdm(anno_paths)
-for annotation_path in anno_paths_bar:
-    # print(annotation_path)
-    anno_paths_bar.set_description(annotation_path.split('/')[-3] + '_' + annotation_path.split('/')[-2])
-    elements = str(annotation_path).split('/')
-    out_file_name = elements[-3] + '_' + elements[-2] + out_format
+def handle_process(task):
+    annotation_path, out_file_name, signature = task
     convert_pc2ply(annotation_path, out_file_name)
+    return out_file_name, signature
+
+if __name__ == '__main__':
+    print('start preprocess')
+    os.makedirs(tmp_path, exist_ok=True)
+    manifest = load_manifest(manifest_file)
+
+    # Note: there is an extra character in the v1.2 data in Area_5/hallway_6. It's fixed manually.
+    tasks = []
+    for annotation_path in anno_paths:
+        elements = str(annotation_path).split('/')
+        out_file_name = elements[-3] + '_' + elements[-2] + out_format
+        signature = file_signature(glob.glob(join(annotation_path, '*.txt')))
+        if exists(join(args.processed_data_path, out_file_name)):
+            if out_file_name not in manifest: # converted before manifests existed
+                manifest[out_file_name] = signature
+            if manifest[out_file_name] == signature:
+                continue
+        tasks.append((annotation_path, out_file_name, signature))
+    save_manifest(manifest_file, manifest)
+    print('{} rooms to convert, {} up to date'.format(len(tasks), len(anno_paths) - len(tasks)))
+
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = [pool.submit(handle_process, task) for task in tasks]
+        for future in tqdm(as_completed(futures), total=len(futures)):
+            out_file_name, signature = future.result()
+            manifest[out_file_name] = signature
+            save_manifest(manifest_file, manifest)
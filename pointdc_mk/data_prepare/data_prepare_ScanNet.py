@@ -8,12 +8,15 @@ ROOT_DIR = dirname(BASE_DIR)
 sys.path.append(BASE_DIR)
 sys.path.append(ROOT_DIR)
 from lib.helper_ply import read_ply, write_ply
-from concurrent.futures import ProcessPoolExecutor
+from lib.manifest import load_manifest, save_manifest, file_digest
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from tqdm import tqdm
 import argparse
 
 parser = argparse.ArgumentParser()
 parser.add_argument('--data_path', type=str, default='data/ScanNet/', help='raw data path')
 parser.add_argument('--processed_data_path', type=str, default='data/ScanNet/')
+parser.add_argument('--workers', type=int, default=30, help='how many scenes are processed in parallel')
 args = parser.parse_args()
 
 SCANNET_RAW_PATH = Path(join(ROOT_DIR, args.data_path))
@@ -44,41 +47,69 @@ for l in range(NUM_LABELS):
         label_map[l] = n_used
         n_used += 1
 
-def handle_process(path):
+# Lookup table of the remapping, indexed by raw label
+label_lut = np.array([label_map[l] for l in range(NUM_LABELS)], dtype=np.int64)
+
+def remap_labels(label, path):
+    label = label.astype(np.int64)
+    '''Fix Data Bug'''
+    for item, bug_index in BUGS.items():
+        if item in path:
+            print('Fixing {} bugged label'.format(item))
+            label[label == bug_index] = 0
+    return label_lut[label]
+
+def handle_process(task):
+    path, previous_digest = task
     f = Path(path.split(',')[0])
     phase_out_path = Path(path.split(',')[1])
+    label_f = f.parent / (f.stem + '.labels' + f.suffix)
+    out_f = phase_out_path / (f.name[:-len(POINTCLOUD_FILE)] + f.suffix)
+    key = phase_out_path.name + '/' + out_f.name
+
+    # Skip scans whose source files did not change since they were processed
+    digest = file_digest([f, label_f] if label_f.is_file() else [f])
+    if digest == previous_digest and out_f.is_file():
+        return key, digest
+
     # pointcloud = read_ply(f)
-    data = read_ply(str(f), triangular_mesh=True)[0]
-    coords = np.vstack((data['x'], data['y'], data['z'])).T
-    colors = np.vstack((data['red'], data['green'], data['blue'])).T
+    # Faces are not used, only the vertex element of the meshes is decoded
+    coords, colors = read_ply(str(f), triangular_mesh=True, read_faces=False, fields=[['x', 'y', 'z'], ['red', 'green', 'blue']])
     # Load label file.
-    label_f = f.parent / (f.stem + '.labels' + f.suffix)
     if label_f.is_file():
-        label = read_ply(str(label_f), triangular_mesh=True)[0]['label'].T.squeeze()
+        label = read_ply(str(label_f), triangular_mesh=True, read_faces=False, fields=['label'])[0]
     else:  # Label may not exist in test case.
-        label = -np.zeros(data.shape)
-    out_f = phase_out_path / (f.name[:-len(POINTCLOUD_FILE)] + f.suffix)
+        label = -np.zeros(coords.shape[0])
 
-    '''Fix Data Bug'''
-    for item, bug_index in BUGS.items():
-        if item in path:
-            print('Fixing {} bugged label'.format(item))
-            bug_mask = label == bug_index
-            label[bug_mask] = 0
-
-    label = np.array([label_map[x] for x in label])
+    label = remap_labels(label, path)
     write_ply(str(out_f), [coords.astype(np.float64), colors, label[:, None].astype(np.float64)], ['x', 'y', 'z', 'red', 'green', 'blue', 'class'])
+    return key, digest
+
 
+if __name__ == '__main__':
+    print('start preprocess')
+    manifest_file = str(SCANNET_OUT_PATH / 'manifest.json')
+    manifest = load_manifest(manifest_file)
 
-print('start preprocess')
+    path_list = []
+    for out_path, in_path in SUBSETS.items():
+        phase_out_path = SCANNET_OUT_PATH / out_path
+        # phase_out_path = SCANNET_OUT_PATH
+        phase_out_path.mkdir(parents=True, exist_ok=True)
+        for f in (SCANNET_RAW_PATH / in_path).glob('*/*' + POINTCLOUD_FILE):
+            path_list.append(str(f) + ',' + str(phase_out_path))
 
-path_list = []
-for out_path, in_path in SUBSETS.items():
-    phase_out_path = SCANNET_OUT_PATH / out_path
-    # phase_out_path = SCANNET_OUT_PATH
-    phase_out_path.mkdir(parents=True, exist_ok=True)
-    for f in (SCANNET_RAW_PATH / in_path).glob('*/*' + POINTCLOUD_FILE):
-        path_list.append(str(f) + ',' + str(phase_out_path))
+    tasks = []
+    for path in path_list:
+        f = Path(path.split(',')[0])
+        key = Path(path.split(',')[1]).name + '/' + f.name[:-len(POINTCLOUD_FILE)] + f.suffix
+        tasks.append((path, manifest.get(key)))
 
-pool = ProcessPoolExecutor(max_workers=30)
-result = list(pool.map(handle_process, path_list))
\ No newline at end of file
+    # The manifest is only updated here, a scene interrupted mid-write is processed again
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = [pool.submit(handle_process, task) for task in tasks]
+        for future in tqdm(as_completed(futures), total=len(futures)):
+            key, digest = future.result()
+            if manifest.get(key) != digest:
+                manifest[key] = digest
+                save_manifest(manifest_file, manifest)
@@ -1,7 +1,4 @@
-from pclpy import pcl
-import pclpy
 import numpy as np
-from scipy import stats
 import os
 os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
 from os.path import join, exists, dirname, abspath
@@ -11,58 +8,33 @@ BASE_DIR = dirname(abspath(__file__))
 ROOT_DIR = dirname(BASE_DIR)
 sys.path.append(BASE_DIR)
 sys.path.append(ROOT_DIR)
-from lib.helper_ply import read_ply, write_ply
-import time
+from lib.helper_ply import read_ply
+from lib.superpoint_utils import superpoint_stats, merge_superpoint_stats, format_superpoint_stats
+from lib.supervoxel import initial_superpoints, BACKENDS
+from lib.task_pool import run_tasks
 import MinkowskiEngine as ME
-import matplotlib.pyplot as plt
-from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from tqdm import tqdm
 
-colormap = []
-for _ in range(1000):
-    for k in range(12):
-        colormap.append(plt.cm.Set3(k))
-    for k in range(9):
-        colormap.append(plt.cm.Set1(k))
-    for k in range(8):
-        colormap.append(plt.cm.Set2(k))
-colormap.append((0, 0, 0, 0))
-colormap = np.array(colormap)
 import argparse
 
 parser = argparse.ArgumentParser()
 parser.add_argument('--input_path', type=str, default='data/S3DIS/processed', help='raw data path')
 parser.add_argument('--sp_path', type=str, default='data/S3DIS/initial_superpoints')
+parser.add_argument('--backend', type=str, default='pcl', choices=BACKENDS, help='pcl: pclpy, numpy: scipy reimplementation without PCL')
+parser.add_argument('--pcl_threads', type=int, default=2, help='threads of PCL normal estimation per scene')
+parser.add_argument('--workers', type=int, default=None, help='scenes processed in parallel, cores // pcl_threads by default')
+parser.add_argument('--timeout', type=float, default=3600, help='seconds before a scene is killed, 0 to wait forever')
+parser.add_argument('--retries', type=int, default=1, help='how many times a failed or timed out scene is retried')
 args = parser.parse_args()
 
 args.input_path = join(ROOT_DIR, args.input_path)
 args.sp_path = join(ROOT_DIR, args.sp_path)
+if args.workers is None:
+    args.workers = max(1, os.cpu_count() // args.pcl_threads)
 
 # ignore_label = 12
 voxel_size = 0.05
-vis = True
-
-def supervoxel_clustering(coords, rgb=None):
-    pc = pcl.PointCloud.PointXYZRGBA(coords, rgb)
-    normals = pc.compute_normals(radius=3, num_threads=2)
-    vox = pcl.segmentation.SupervoxelClustering.PointXYZRGBA(voxel_resolution=1, seed_resolution=10)
-    vox.setInputCloud(pc)
-    vox.setNormalCloud(normals)
-    vox.setSpatialImportance(0.4)
-    vox.setNormalImportance(1)
-    vox.setColorImportance(0.2)
-    output = pcl.vectors.map_uint32t_PointXYZRGBA()
-    vox.extract(output)
-    return list(output.items())
-
-def region_growing_simple(coords):
-    pc = pcl.PointCloud.PointXYZ(coords)
-    normals = pc.compute_normals(radius=3, num_threads=2)
-    clusters = pclpy.region_growing(pc, normals=normals, min_size=1, max_size=100000, n_neighbours=15,
-                                    smooth_threshold=3, curvature_threshold=1, residual_threshold=1)
-    return clusters, normals.normals
-
 
 def construct_superpoints(path):
     f = Path(path)
@@ -73,7 +45,6 @@ def construct_superpoints(path):
     coords = coords.astype(np.float32)
     coords -= coords.mean(0)
 
-    time_start = time.time()
     '''Voxelize'''
     scale = 1 / voxel_size
     coords = np.floor(coords * scale)
@@ -81,82 +52,58 @@ def construct_superpoints(path):
                             feats, labels=labels, ignore_label=-1, return_index=True, return_inverse=True)
     coords = coords.numpy().astype(np.float32)
 
-    '''VCCS'''
-    out = supervoxel_clustering(coords, feats)
-    voxel_idx = -np.ones_like(labels)
-    voxel_num = 0
-    for voxel in range(len(out)):
-        if out[voxel][1].voxels_.xyz.shape[0] >= 0:
-            for xyz_voxel in out[voxel][1].voxels_.xyz:
-                index_colum = np.where((xyz_voxel == coords).all(1))
-                voxel_idx[index_colum] = voxel_num
-            voxel_num += 1
-
-    '''Region Growing'''
-    clusters = region_growing_simple(coords)[0]
-    region_idx = -1 * np.ones_like(labels)
-    for region in range(len(clusters)):
-        for point_idx in clusters[region].indices:
-            region_idx[point_idx] = region
-
-    '''Merging'''
-    merged = -np.ones_like(labels)
-    voxel_idx[voxel_idx != -1] += len(clusters)
-    for v in np.unique(voxel_idx):
-        if v != -1:
-            voxel_mask = v == voxel_idx
-            voxel2region = region_idx[voxel_mask] ### count which regions are appeared in current voxel
-            dominant_region = stats.mode(voxel2region)[0][0]
-            if (dominant_region == voxel2region).sum() > voxel2region.shape[0] * 0.5:
-                merged[voxel_mask] = dominant_region
-            else:
-                merged[voxel_mask] = v
-
-    '''Make Superpoint Labels Continuous'''
-    sp_labels = -np.ones_like(merged)
-    count_num = 0
-    for m in np.unique(merged):
-        if m != -1:
-            sp_labels[merged == m] = count_num
-            count_num += 1
+    '''VCCS + Region Growing, Merged and Made Continuous'''
+    sp_labels = initial_superpoints(coords, feats, backend=args.backend, num_threads=args.pcl_threads)
 
     '''ReProject to Input Point Cloud'''
     out_sp_labels = sp_labels[inverse_map]
-    out_coords = np.vstack((data['x'], data['y'], data['z'])).T
     out_labels = data['class'].squeeze()
     #
     if not exists(args.sp_path):
         os.makedirs(args.sp_path)
-    np.save(args.sp_path + '/' + f.name[:-4] + '_superpoint.npy', out_sp_labels)
-
-    if vis:
-        vis_path = args.sp_path +'/vis/'
-        if not os.path.exists(vis_path):
-            os.makedirs(vis_path)
-        colors = np.zeros_like(out_coords)
-        for p in range(colors.shape[0]):
-            colors[p] = 255 * (colormap[out_sp_labels[p].astype(np.int32)])[:3]
-        colors = colors.astype(np.uint8)
-        write_ply(vis_path + '/' + f.name, [out_coords, colors], ['x', 'y', 'z', 'red', 'green', 'blue'])
-
-    sp2gt = -np.ones_like(out_labels)
-    for sp in np.unique(out_sp_labels):
-        if sp != -1:
-            sp_mask = sp == out_sp_labels
-            sp2gt[sp_mask] = stats.mode(out_labels[sp_mask])[0][0]
-
-    print('completed scene: {}, used time: {:.2f}s'.format(f.name, time.time() - time_start))
-    return (out_labels, sp2gt)
-
-
-
-print('start constructing initial superpoints')
-path_list = []
-folders = sorted(glob.glob(args.input_path + '/*.ply'))
-for _, file in enumerate(folders):
-    path_list.append(file)
-    
-construct_superpoints(path_list[0])
-# pool = ProcessPoolExecutor(max_workers=40)
-# result = list(pool.map(construct_superpoints, path_list))
-print('end constructing initial superpoints')
+    # Saved aside then moved, a killed scene is never mistaken for a finished one
+    with open(sp_file(path) + '.tmp', 'wb') as sp_f:
+        np.save(sp_f, out_sp_labels)
+    os.replace(sp_file(path) + '.tmp', sp_file(path))
+
+    return superpoint_stats(out_sp_labels, out_labels)
+
+
+def sp_file(path):
+    return join(args.sp_path, Path(path).name[:-4] + '_superpoint.npy')
+
+def handle_process(path):
+    return construct_superpoints(path)
+
+
+if __name__ == '__main__':
+    print('start constructing initial superpoints')
+    os.makedirs(args.sp_path, exist_ok=True)
+    path_list = sorted(glob.glob(args.input_path + '/*.ply'))
+    todo = [path for path in path_list if not exists(sp_file(path))]
+    print('{} scenes to process, {} already done'.format(len(todo), len(path_list) - len(todo)))
+
+    # Largest scenes first so that no big room is left running alone at the end
+    num_points = {path: len(read_ply(path, mmap=True)) for path in todo}
+    todo.sort(key=lambda path: -num_points[path])
+
+    timings, failed, sp_stats = [], [], []
+    results = run_tasks(handle_process, todo, workers=args.workers, timeout=args.timeout or None, retries=args.retries)
+    for path, stats, elapsed, attempts, error in tqdm(results, total=len(todo)):
+        if error is None:
+            timings.append((elapsed, path))
+            sp_stats.append(stats)
+        else:
+            failed.append(Path(path).name)
+            tqdm.write('failed scene: {} after {} attempts\n{}'.format(Path(path).name, attempts, error))
+
+    if len(timings) > 0:
+        elapsed = np.array([t for t, _ in timings])
+        print('scene time: mean {:.1f}s, median {:.1f}s, max {:.1f}s, total {:.1f}s'.format(
+            elapsed.mean(), np.median(elapsed), elapsed.max(), elapsed.sum()))
+        for t, path in sorted(timings, reverse=True)[:5]:
+            print('  {}: {:.1f}s ({} points)'.format(Path(path).name, t, num_points[path]))
+        print('superpoints of the processed scenes: {}'.format(format_superpoint_stats(merge_superpoint_stats(sp_stats))))
+    if len(failed) > 0:
+        print('{} scenes failed: {}'.format(len(failed), ', '.join(sorted(failed))))
+    print('end constructing initial superpoints')
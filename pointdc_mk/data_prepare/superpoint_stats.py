@@ -0,0 +1,51 @@
+import numpy as np
+from os.path import join, exists, dirname, abspath, basename
+import os, sys, glob
+import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+BASE_DIR = dirname(abspath(__file__))
+ROOT_DIR = dirname(BASE_DIR)
+sys.path.append(BASE_DIR)
+sys.path.append(ROOT_DIR)
+from lib.scene_store import read_scene
+from lib.superpoint_utils import superpoint_stats, merge_superpoint_stats, format_superpoint_stats, format_size_histogram
+from tqdm import tqdm
+
+parser = argparse.ArgumentParser(description='purity, sizes and coverage of the superpoints of a dataset')
+parser.add_argument('--pc_path', type=str, default='data/S3DIS/processed', help='processed ply path') # ScanNet: data/ScanNet/train
+parser.add_argument('--sp_path', type=str, default='data/S3DIS/initial_superpoints', help='superpoint path')
+parser.add_argument('--drop_threshold', type=int, default=50, help='superpoints with fewer labeled points are dropped by the datasets')
+parser.add_argument('--ignore_label', type=int, default=-1, help='invalid label')
+parser.add_argument('--output', type=str, default=None, help='json file receiving the per-scene and total counts')
+parser.add_argument('--verbose', action='store_true', help='print every scene')
+parser.add_argument('--workers', type=int, default=8, help='how many processes')
+args = parser.parse_args()
+
+args.pc_path = join(ROOT_DIR, args.pc_path)
+args.sp_path = join(ROOT_DIR, args.sp_path)
+
+
+def scene_stats(name):
+    labels = read_scene(join(args.pc_path, name + '.ply'), fields=['labels'])[0]
+    sp_labels = np.load(join(args.sp_path, name + '_superpoint.npy'))
+    return superpoint_stats(sp_labels, labels, args.drop_threshold, args.ignore_label)
+
+
+if __name__ == '__main__':
+    names = sorted(basename(f)[:-len('_superpoint.npy')] for f in glob.glob(join(args.sp_path, '*_superpoint.npy')))
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        per_scene = dict(zip(names, tqdm(pool.map(scene_stats, names), total=len(names))))
+
+    if args.verbose:
+        for name, stats in per_scene.items():
+            print('{}: {}'.format(name, format_superpoint_stats(stats)))
+    total = merge_superpoint_stats(per_scene.values())
+    print('{} scenes: {}'.format(len(names), format_superpoint_stats(total)))
+    print('superpoint sizes (points):')
+    print(format_size_histogram(total['size_histogram']))
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump({'scenes': per_scene, 'total': total}, f, indent=1)
@@ -0,0 +1,62 @@
+import numpy as np
+from os.path import join, exists, dirname, abspath, basename
+import os, sys, glob
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+BASE_DIR = dirname(abspath(__file__))
+ROOT_DIR = dirname(BASE_DIR)
+sys.path.append(BASE_DIR)
+sys.path.append(ROOT_DIR)
+from lib.helper_ply import read_ply, project_fields, PlyStreamWriter
+from lib.superpoint_utils import superpoint_colormap, superpoint_colors
+from tqdm import tqdm
+
+parser = argparse.ArgumentParser(description='color the points of each scene by superpoint, for inspection')
+parser.add_argument('--pc_path', type=str, default='data/S3DIS/processed', help='processed ply path') # ScanNet: data/ScanNet/train
+parser.add_argument('--sp_path', type=str, default='data/S3DIS/initial_superpoints', help='superpoint path')
+parser.add_argument('--vis_path', type=str, default=None, help='output path, sp_path/vis by default')
+parser.add_argument('--scenes', type=str, nargs='*', default=None, help='scene names, all scenes by default')
+parser.add_argument('--sample_ratio', type=float, default=1.0, help='fraction of the points kept, for lighter previews')
+parser.add_argument('--chunk_size', type=int, default=1 << 20, help='points written per batch')
+parser.add_argument('--workers', type=int, default=8, help='how many processes')
+args = parser.parse_args()
+
+args.pc_path = join(ROOT_DIR, args.pc_path)
+args.sp_path = join(ROOT_DIR, args.sp_path)
+args.vis_path = join(args.sp_path, 'vis') if args.vis_path is None else join(ROOT_DIR, args.vis_path)
+
+colormap = superpoint_colormap()
+
+
+def visualize(name):
+    data = read_ply(join(args.pc_path, name + '.ply'), mmap=True)
+    sp_labels = np.load(join(args.sp_path, name + '_superpoint.npy'), mmap_mode='r')
+    keep = np.arange(data.shape[0])
+    if args.sample_ratio < 1:
+        rng = np.random.default_rng(0)
+        keep = np.sort(rng.choice(keep, int(np.ceil(keep.shape[0] * args.sample_ratio)), replace=False))
+
+    field_names = ['x', 'y', 'z', 'red', 'green', 'blue']
+    with PlyStreamWriter(join(args.vis_path, name + '.ply'), field_names, [np.float32] * 3 + [np.uint8] * 3,
+                         num_points=keep.shape[0]) as writer:
+        for start in range(0, keep.shape[0], args.chunk_size):
+            index = keep[start:start + args.chunk_size]
+            coords = project_fields(data[index], [['x', 'y', 'z']], [np.float32])[0]
+            writer.write([coords, superpoint_colors(sp_labels[index], colormap)])
+    return name
+
+
+if __name__ == '__main__':
+    names = args.scenes
+    if names is None:
+        names = sorted(basename(f)[:-len('_superpoint.npy')] for f in glob.glob(join(args.sp_path, '*_superpoint.npy')))
+    missing = [name for name in names if not exists(join(args.pc_path, name + '.ply'))]
+    if len(missing) > 0:
+        print('no point cloud for {} scenes, skipped: {}'.format(len(missing), ', '.join(missing)))
+    names = [name for name in names if name not in missing]
+
+    os.makedirs(args.vis_path, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        list(tqdm(pool.map(visualize, names), total=len(names)))
+    print('wrote {} superpoint visualizations to {}'.format(len(names), args.vis_path))
@@ -3,17 +3,25 @@ import os
 from glob import glob
 import numpy as np
 from torch.utils.data import Dataset
-import MinkowskiEngine as ME
 import random
 import open3d as o3d
-from lib.aug_tools import rota_coords, scale_coords, trans_coords
+from lib.aug_tools import affine_coords
 from lib.helper_ply import read_ply as read_ply
+from lib.scene_store import read_scene
+from lib.scene_cache import SceneCache
+from lib.scene_index import voxel_tag
+from lib.collate import collate_points, COORDS, POINTS, COLUMN, INDS, LIST
+from lib.voxel_cache import VoxelCache, quantize
+from lib.superpoint_utils import compact_superpoints, drop_superpoints
+from lib.preload import preload
 from os.path import join
 from tqdm import tqdm
 
 class S3DISdistill(Dataset):
     def __init__(self, args, areas=['Area_1', 'Area_2', 'Area_3', 'Area_4', 'Area_6']):
         self.args = args
+        self.cache = SceneCache(self.args.cache_budget * 1024**3)
+        self.voxel_cache = VoxelCache(self.args.voxel_cache_path, self.cache)
         self.name = []
         self.mode = 'disitll'
         self.clip_bound = 4 # 4m
@@ -33,24 +41,22 @@ class S3DISdistill(Dataset):
                                12: 'clutter'}
 
         ''' Reading Data'''
-        folders_bar = tqdm(sorted(glob(join(self.args.data_path, 'input_spfeats', '*.pt'))))
-        for file in folders_bar:
-            folders_bar.set_description('PreLoad')
+        self.feats_file = []
+        for file in sorted(glob(join(self.args.data_path, 'input_spfeats', '*.pt'))):
             ptname = os.path.basename(file)
             if ptname[0:6] in areas:
                 self.name.append(ptname[0:-14])
-                self.file.append(torch.load(file))
+                self.feats_file.append(file)
+        # scenes past --preload_budget are loaded in __getitem__
+        budget = None if self.args.preload_budget is None else self.args.preload_budget * 1024**3
+        self.file = preload(self.feats_file, torch.load, workers=self.args.preload_workers, budget=budget, desc='PreLoad')
 
         '''Initial Augmentations'''
-        self.trans_coords = trans_coords(shift_ratio=50) ### 50%
-        self.rota_coords = rota_coords(rotation_bound = ((-np.pi/32, np.pi/32), (-np.pi/32, np.pi/32), (-np.pi, np.pi)))
-        self.scale_coords = scale_coords(scale_bound = (0.9, 1.1))
+        self.affine_coords = affine_coords(rotation_bound = ((-np.pi/32, np.pi/32), (-np.pi/32, np.pi/32), (-np.pi, np.pi)), shift_ratio=50, scale_bound=(0.9, 1.1)) ### 50% shift
 
 
     def augs(self, coords, feats):
-        coords = self.rota_coords(coords)
-        coords = self.trans_coords(coords)
-        coords = self.scale_coords(coords)
+        coords = self.affine_coords(coords)
         return coords, feats
 
     def augment_coords_to_feats(self, coords, colors, labels=None):
@@ -79,38 +85,51 @@ class S3DISdistill(Dataset):
                              (coords[:, 2] >= (-lim + center[2])) & (coords[:, 2] < (lim + center[2])))
                 return clip_inds
 
-    def voxelize(self, coords, feats, labels):
+    def voxelize(self, coords, feats, labels, scene_file=None):
         assert coords.shape[1] == 3 and coords.shape[0] == feats.shape[0] and coords.shape[0]
-        clip_inds = self.clip(coords)
+        def clip_and_quantize():
+            clip_inds = self.clip(coords)
+            if clip_inds is None:
+                return quantize(coords, self.args.voxel_size, labels)
+            voxels = quantize(coords[clip_inds], self.args.voxel_size, None if labels is None else labels[clip_inds])
+            voxels['clip_inds'] = clip_inds
+            return voxels
+
+        voxels = self.voxel_cache.get(scene_file, (self.args.voxel_size, self.clip_bound, labels is not None), clip_and_quantize)
+        clip_inds = voxels.get('clip_inds')
         if clip_inds is not None:
-            coords, feats = coords[clip_inds], feats[clip_inds]
-            if labels is not None:
-                labels = labels[clip_inds]
-
-        scale = 1 / self.args.voxel_size
-        coords = np.floor(coords * scale)
-        coords, feats, labels, unique_map, inverse_map = \
-                    ME.utils.sparse_quantize(np.ascontiguousarray(coords), feats, \
-                    labels=labels, ignore_label=-1, return_index=True, return_inverse=True)
-        return coords.numpy(), feats, labels, unique_map, clip_inds, inverse_map.numpy()
+            feats = feats[clip_inds]
+        unique_map = voxels['unique_map']
+        return voxels['coords'], feats[unique_map], voxels.get('labels'), unique_map, clip_inds, voxels['inverse_map']
 
     def __len__(self):
         return len(self.file)
 
+    def voxel_tag(self):
+        """Scene index column of the voxel counts of voxel_count"""
+        return voxel_tag(self.args.voxel_size, clip_bound=self.clip_bound)
+
+    def voxel_count(self, index):
+        """Voxels of a scene after clipping, what it weighs in a batch"""
+        scene_file = self.args.sp_path+'processed/'+self.name[index]+'.ply'
+        coords, colors = read_scene(scene_file, fields=['coords', 'colors'])
+        return len(self.voxelize(coords - coords.mean(0), colors, None, scene_file)[0])
+
     def __getitem__(self, index):
         dinofeats = self.file[index]
-        data = read_ply(self.args.sp_path+'processed/'+self.name[index]+'.ply')
-        coords, colors, labels = np.vstack((data['x'], data['y'], data['z'])).T, np.vstack((data['red'], data['green'], data['blue'])).T, data['class']
+        if dinofeats is None:
+            dinofeats = torch.load(self.feats_file[index])
+        scene_file = self.args.sp_path+'processed/'+self.name[index]+'.ply'
+        coords, colors = self.cache.read_scene(scene_file, fields=['coords', 'colors'])
         colors = colors.astype(np.float32)
-        coords = coords.astype(np.float32)
         coords -= coords.mean(0)
-        labels = np.ones(coords.shape[0])
 
-        coords, colors, labels, unique_map, clip_inds, inverse_map = self.voxelize(coords, colors, labels)
+        coords, colors, _, unique_map, clip_inds, inverse_map = self.voxelize(coords, colors, None, scene_file)
+        labels = np.ones(coords.shape[0])
         coords = coords.astype(np.float32)
 
         region_file = self.args.sp_path + 'initial_superpoints_rebuild/' + self.name[index] + '_rebuild_superpoint.npy'
-        region      = np.load(region_file).astype(np.int64)
+        region      = self.cache.load(region_file).astype(np.int64)
         dinofeats   = dinofeats[region+1]
 
         '''Clip if Scene includes much Points'''
@@ -134,6 +153,8 @@ class S3DISdistill(Dataset):
 class S3DIScluster(Dataset):
     def __init__(self, args, areas=['Area_1', 'Area_2', 'Area_3', 'Area_4', 'Area_6']):
         self.args = args
+        self.cache = SceneCache(self.args.cache_budget * 1024**3)
+        self.voxel_cache = VoxelCache(self.args.voxel_cache_path, self.cache)
         self.name = []
         self.file = []
         self.label_to_names = {0: 'ceiling',
@@ -159,14 +180,10 @@ class S3DIScluster(Dataset):
                 self.file.append(file)
 
         '''Initial Augmentations'''
-        self.trans_coords = trans_coords(shift_ratio=50) ### 50%
-        self.rota_coords = rota_coords(rotation_bound = ((-np.pi/32, np.pi/32), (-np.pi/32, np.pi/32), (-np.pi, np.pi)))
-        self.scale_coords = scale_coords(scale_bound = (0.9, 1.1))
+        self.affine_coords = affine_coords(rotation_bound = ((-np.pi/32, np.pi/32), (-np.pi/32, np.pi/32), (-np.pi, np.pi)), shift_ratio=50, scale_bound=(0.9, 1.1)) ### 50% shift
 
     def augs(self, coords, feats):
-        coords = self.rota_coords(coords)
-        coords = self.trans_coords(coords)
-        coords = self.scale_coords(coords)
+        coords = self.affine_coords(coords)
         return coords, feats
 
     def augment_coords_to_feats(self, coords, colors, labels=None):
@@ -178,31 +195,28 @@ class S3DIScluster(Dataset):
         feats = np.concatenate((colors, feats), axis=-1)
         return norm_coords, feats, labels
 
-    def voxelize(self, coords, feats, labels):
+    def voxelize(self, coords, feats, labels, scene_file=None):
         assert coords.shape[1] == 3 and coords.shape[0] == feats.shape[0] and coords.shape[0]
 
-        scale = 1 / self.args.voxel_size
-        coords = np.floor(coords * scale)
-        coords, feats, labels, unique_map, inverse_map = ME.utils.sparse_quantize(np.ascontiguousarray(coords), feats, labels=labels, ignore_label=-1, return_index=True, return_inverse=True)
-        return coords.numpy(), feats, labels, unique_map, inverse_map.numpy()
+        voxels = self.voxel_cache.get(scene_file, (self.args.voxel_size, labels is not None), \
+                                      lambda: quantize(coords, self.args.voxel_size, labels))
+        unique_map = voxels['unique_map']
+        return voxels['coords'], feats[unique_map], voxels.get('labels'), unique_map, voxels['inverse_map']
 
     def __len__(self):
         return len(self.file)
 
     def __getitem__(self, index):
         scene_name = self.name[index] 
-        data = read_ply(self.file[index])
-        coords, colors, labels = np.vstack((data['x'], data['y'], data['z'])).T, \
-                                    np.vstack((data['red'], data['green'], data['blue'])).T, data['class']
+        coords, colors, labels = self.cache.read_scene(self.file[index])
         colors = colors.astype(np.float32)
-        coords = coords.astype(np.float32)
         coords -= coords.mean(0)
         
         # load region 
         region_file = self.args.sp_path + 'initial_superpoints/' + scene_name + '_superpoint.npy'
-        region = np.load(region_file)
+        region = self.cache.load(region_file)
         
-        coords, colors, _, unique_map, inverse_map = self.voxelize(coords, colors, labels)
+        coords, colors, _, unique_map, inverse_map = self.voxelize(coords, colors, labels, self.file[index])
         coords = coords.astype(np.float32)
 
         inds = np.arange(coords.shape[0])
@@ -213,22 +227,17 @@ class S3DIScluster(Dataset):
         normals = np.zeros_like(coords)  
         pseudo  = -np.ones_like(labels).astype(np.long)
         
-        region[labels==-1] = -1
-        for q in np.unique(region):
-            mask = q == region
-            if mask.sum() < self.args.drop_threshold and q != -1:
-                region[mask] = -1
-        valid_region = region[region != -1]
-        unique_vals = np.unique(valid_region)
-        unique_vals.sort()
-        valid_region = np.searchsorted(unique_vals, valid_region)
-        region[region != -1] = valid_region
+        # the same for a scene at every clustering round
+        region = self.cache.get(('dropped superpoints', self.file[index], self.args.drop_threshold, self.args.ignore_label), \
+                                lambda: drop_superpoints(np.where(labels == -1, -1, region), self.args.drop_threshold))
 
         return coords, feats, normals, labels, inverse_map, pseudo, inds, region, index, scene_name
 
 class S3DIStrain(Dataset):
     def __init__(self, args, areas=['Area_1', 'Area_2', 'Area_3', 'Area_4', 'Area_6']):
         self.args = args
+        self.cache = SceneCache(self.args.cache_budget * 1024**3)
+        self.voxel_cache = VoxelCache(self.args.voxel_cache_path, self.cache)
         self.name = []
         self.mode = 'train'
         self.clip_bound = 4 # 4m
@@ -256,14 +265,10 @@ class S3DIStrain(Dataset):
                 self.file.append(file)
 
         '''Initial Augmentations'''
-        self.trans_coords = trans_coords(shift_ratio=50) ### 50%
-        self.rota_coords = rota_coords(rotation_bound = ((-np.pi/32, np.pi/32), (-np.pi/32, np.pi/32), (-np.pi, np.pi)))
-        self.scale_coords = scale_coords(scale_bound = (0.9, 1.1))
+        self.affine_coords = affine_coords(rotation_bound = ((-np.pi/32, np.pi/32), (-np.pi/32, np.pi/32), (-np.pi, np.pi)), shift_ratio=50, scale_bound=(0.9, 1.1)) ### 50% shift
 
     def augs(self, coords, feats):
-        coords = self.rota_coords(coords)
-        coords = self.trans_coords(coords)
-        coords = self.scale_coords(coords)
+        coords = self.affine_coords(coords)
         return coords, feats
 
     def augment_coords_to_feats(self, coords, colors, labels=None):
@@ -292,35 +297,46 @@ class S3DIStrain(Dataset):
                              (coords[:, 2] >= (-lim + center[2])) & (coords[:, 2] < (lim + center[2])))
                 return clip_inds
 
-    def voxelize(self, coords, feats, labels):
+    def voxelize(self, coords, feats, labels, scene_file=None):
         assert coords.shape[1] == 3 and coords.shape[0] == feats.shape[0] and coords.shape[0]
-        clip_inds = self.clip(coords)
+        def clip_and_quantize():
+            clip_inds = self.clip(coords)
+            if clip_inds is None:
+                return quantize(coords, self.args.voxel_size, labels)
+            voxels = quantize(coords[clip_inds], self.args.voxel_size, None if labels is None else labels[clip_inds])
+            voxels['clip_inds'] = clip_inds
+            return voxels
+
+        voxels = self.voxel_cache.get(scene_file, (self.args.voxel_size, self.clip_bound, labels is not None), clip_and_quantize)
+        clip_inds = voxels.get('clip_inds')
         if clip_inds is not None:
-            coords, feats = coords[clip_inds], feats[clip_inds]
-            if labels is not None:
-                labels = labels[clip_inds]
-
-        scale = 1 / self.args.voxel_size
-        coords = np.floor(coords * scale)
-        coords, feats, labels, unique_map, inverse_map = ME.utils.sparse_quantize(np.ascontiguousarray(coords), feats, labels=labels, ignore_label=-1, return_index=True, return_inverse=True)
-        return coords.numpy(), feats, labels, unique_map, clip_inds, inverse_map.numpy()
+            feats = feats[clip_inds]
+        unique_map = voxels['unique_map']
+        return voxels['coords'], feats[unique_map], voxels.get('labels'), unique_map, clip_inds, voxels['inverse_map']
 
     def __len__(self):
         return len(self.file)
 
+    def voxel_tag(self):
+        """Scene index column of the voxel counts of voxel_count"""
+        return voxel_tag(self.args.voxel_size, clip_bound=self.clip_bound)
+
+    def voxel_count(self, index):
+        """Voxels of a scene after clipping, what it weighs in a batch"""
+        coords, colors, labels = read_scene(self.file[index])
+        return len(self.voxelize(coords - coords.mean(0), colors, labels, self.file[index])[0])
+
     def __getitem__(self, index):
         scene_name = self.name[index] 
-        data = read_ply(self.file[index])
-        coords, colors, labels = np.vstack((data['x'], data['y'], data['z'])).T, np.vstack((data['red'], data['green'], data['blue'])).T, data['class']
+        coords, colors, labels = self.cache.read_scene(self.file[index])
         colors = colors.astype(np.float32)
-        coords = coords.astype(np.float32)
         coords -= coords.mean(0)
         
         # load region 
         region_file = self.args.sp_path + 'initial_superpoints/' + scene_name + '_superpoint.npy'
-        region = np.load(region_file)
+        region = self.cache.load(region_file)
         
-        coords, colors, _, unique_map, clip_inds, inverse_map = self.voxelize(coords, colors, labels)
+        coords, colors, _, unique_map, clip_inds, inverse_map = self.voxelize(coords, colors, labels, self.file[index])
         coords = coords.astype(np.float32)
 
         '''Clip if Scene includes much Points'''
@@ -340,16 +356,9 @@ class S3DIStrain(Dataset):
             normals = np.zeros_like(coords)  
             pseudo  = -np.ones_like(labels).astype(np.long)
             
-            region[labels==-1] = -1
-            for q in np.unique(region):
-                mask = q == region
-                if mask.sum() < self.args.drop_threshold and q != -1:
-                    region[mask] = -1
-            valid_region = region[region != -1]
-            unique_vals = np.unique(valid_region)
-            unique_vals.sort()
-            valid_region = np.searchsorted(unique_vals, valid_region)
-            region[region != -1] = valid_region
+            # the same for a scene at every clustering round
+            region = self.cache.get(('dropped superpoints', self.file[index], self.clip_bound, self.args.drop_threshold, self.args.ignore_label), \
+                                    lambda: drop_superpoints(np.where(labels == -1, -1, region), self.args.drop_threshold))
             
         elif self.mode == 'train':
             normals    = np.zeros_like(coords)
@@ -368,6 +377,8 @@ class S3DIStrain(Dataset):
 class S3DIStest(Dataset):
     def __init__(self, args, areas=['Area_5']):
         self.args = args
+        self.cache = SceneCache(self.args.cache_budget * 1024**3)
+        self.voxel_cache = VoxelCache(self.args.voxel_cache_path, self.cache)
         self.name = []
         self.file = []
         self.label_to_names = {0: 'ceiling',
@@ -401,123 +412,69 @@ class S3DIStest(Dataset):
         feats = np.concatenate((colors, feats), axis=-1)
         return norm_coords, feats, labels
 
-    def voxelize(self, coords, feats, labels):
+    def voxelize(self, coords, feats, labels, scene_file=None):
         assert coords.shape[1] == 3 and coords.shape[0] == feats.shape[0] and coords.shape[0]
-        scale = 1 / self.args.voxel_size
-        coords = np.floor(coords * scale)
-        coords, feats, labels, unique_map, inverse_map = ME.utils.sparse_quantize(np.ascontiguousarray(coords), feats, labels=labels, ignore_label=-1, return_index=True, return_inverse=True)
-        return coords.numpy(), feats, labels, unique_map, inverse_map.numpy()
+        voxels = self.voxel_cache.get(scene_file, (self.args.voxel_size, labels is not None), \
+                                      lambda: quantize(coords, self.args.voxel_size, labels))
+        unique_map = voxels['unique_map']
+        return voxels['coords'], feats[unique_map], voxels.get('labels'), unique_map, voxels['inverse_map']
 
     def __len__(self):
         return len(self.file)
 
     def __getitem__(self, index):
-        data = read_ply(self.file[index])
-        coords, colors, labels = np.vstack((data['x'], data['y'], data['z'])).T, np.vstack((data['red'], data['green'], data['blue'])).T, data['class']
+        coords, colors, labels = self.cache.read_scene(self.file[index])
         colors = colors.astype(np.float32)
-        coords = coords.astype(np.float32)
         coords -= coords.mean(0)
 
-        coords, colors, _, unique_map, inverse_map = self.voxelize(coords, colors, labels)
+        coords, colors, _, unique_map, inverse_map = self.voxelize(coords, colors, labels, self.file[index])
         coords = coords.astype(np.float32)
         region_file = self.args.sp_path + 'initial_superpoints/' + self.name[index] + '_superpoint.npy'
-        region = np.load(region_file)
+        region = self.cache.load(region_file)
 
         labels[labels == self.args.ignore_label] = -1
         region[labels == -1] = -1
         region = region[unique_map]
 
-        valid_region = region[region != -1]
-        unique_vals = np.unique(valid_region)
-        unique_vals.sort()
-        valid_region = np.searchsorted(unique_vals, valid_region)
-
-        region[region != -1] = valid_region
+        region = compact_superpoints(region)
 
         coords, feats, labels = self.augment_coords_to_feats(coords, colors/255-0.5, labels)
         return coords, feats, inverse_map, np.ascontiguousarray(labels), index, region
 
 class cfl_collate_fn_distill:
+    # coords, feats, dinofeats, normals, labels, inverse_map, region, index, scene_name
+    layout = [(COORDS, torch.float32), (POINTS, torch.float32), (POINTS, torch.float32), (POINTS, torch.float32),
+              (POINTS, torch.float32), (POINTS, torch.int32), (COLUMN, None), (LIST, None),
+              (LIST, None)]
+
+    def __init__(self, pin_memory=False):
+        self.pin_memory = pin_memory
 
     def __call__(self, list_data):
-        coords, feats, dinofeats, normals, labels, inverse_map, region, index, scene_name = list(zip(*list_data))
-        coords_batch, feats_batch, dinofeats_batch, normal_batch, labels_batch, inverse_batch, \
-                                            region_batch, scene_batch = [], [], [], [], [], [], [], []
-        accm_num = 0
-        for batch_id, _ in enumerate(coords):
-            num_points = coords[batch_id].shape[0]
-            coords_batch.append(torch.cat((torch.ones(num_points, 1).int() * batch_id, torch.from_numpy(coords[batch_id]).int()), 1))
-            feats_batch.append(torch.from_numpy(feats[batch_id]))
-            dinofeats_batch.append(torch.from_numpy(dinofeats[batch_id]))
-            normal_batch.append(torch.from_numpy(normals[batch_id]))
-            labels_batch.append(torch.from_numpy(labels[batch_id]).int())
-            inverse_batch.append(torch.from_numpy(inverse_map[batch_id]))
-            region_batch.append(torch.from_numpy(region[batch_id])[:,None])
-            scene_batch.append(scene_name[batch_id])
-            accm_num += coords[batch_id].shape[0]
-
-        # Concatenate all lists
-        coords_batch    = torch.cat(coords_batch, 0).float()#.int()
-        feats_batch     = torch.cat(feats_batch, 0).float()
-        dinofeats_batch = torch.cat(dinofeats_batch, 0).float()
-        normal_batch    = torch.cat(normal_batch, 0).float()
-        labels_batch    = torch.cat(labels_batch, 0).float()
-        inverse_batch   = torch.cat(inverse_batch, 0).int()
-        region_batch    = torch.cat(region_batch, 0)
-
-        return coords_batch, feats_batch, dinofeats_batch, normal_batch, labels_batch, inverse_batch, region_batch, index, scene_batch
+        return tuple(collate_points(list_data, self.layout, self.pin_memory))
+
 
 class cfl_collate_fn:
+    # coords, feats, normals, labels, inverse_map, pseudo, inds, region, index, scenenames
+    layout = [(COORDS, torch.float32), (POINTS, torch.float32), (POINTS, torch.float32), (POINTS, torch.float32),
+              (POINTS, torch.int32), (POINTS, None), (INDS, torch.int32), (COLUMN, torch.long),
+              (LIST, None), (LIST, None)]
+
+    def __init__(self, pin_memory=False):
+        self.pin_memory = pin_memory
 
     def __call__(self, list_data):
-        coords, feats, normals, labels, inverse_map, pseudo, inds, region, index, scenenames = list(zip(*list_data))
-        coords_batch, feats_batch, normal_batch, labels_batch, inverse_batch, pseudo_batch, inds_batch = [], [], [], [], [], [], []
-        region_batch = []
-        accm_num = 0
-        for batch_id, _ in enumerate(coords):
-            num_points = coords[batch_id].shape[0]
-            coords_batch.append(torch.cat((torch.ones(num_points, 1).int() * batch_id, torch.from_numpy(coords[batch_id]).int()), 1))
-            feats_batch.append(torch.from_numpy(feats[batch_id]))
-            normal_batch.append(torch.from_numpy(normals[batch_id]))
-            labels_batch.append(torch.from_numpy(labels[batch_id].copy()).int())
-            inverse_batch.append(torch.from_numpy(inverse_map[batch_id]))
-            pseudo_batch.append(torch.from_numpy(pseudo[batch_id]))
-            inds_batch.append(torch.from_numpy(inds[batch_id] + accm_num).int())
-            region_batch.append(torch.from_numpy(region[batch_id])[:,None])
-            accm_num += coords[batch_id].shape[0]
-
-        # Concatenate all lists
-        coords_batch = torch.cat(coords_batch, 0).float()#.int()
-        feats_batch = torch.cat(feats_batch, 0).float()
-        normal_batch = torch.cat(normal_batch, 0).float()
-        labels_batch = torch.cat(labels_batch, 0).float()
-        inverse_batch = torch.cat(inverse_batch, 0).int()
-        pseudo_batch = torch.cat(pseudo_batch, -1)
-        inds_batch = torch.cat(inds_batch, 0)
-        region_batch = torch.cat(region_batch, 0).long()
-
-        return coords_batch, feats_batch, normal_batch, labels_batch, inverse_batch, pseudo_batch, inds_batch, region_batch, index, scenenames
+        return tuple(collate_points(list_data, self.layout, self.pin_memory))
+
 
 
 class cfl_collate_fn_test:
+    # coords, feats, inverse_map, labels, index, region
+    layout = [(COORDS, torch.float32), (POINTS, torch.float32), (POINTS, torch.int32), (POINTS, torch.int32),
+              (LIST, None), (COLUMN, None)]
+
+    def __init__(self, pin_memory=False):
+        self.pin_memory = pin_memory
 
     def __call__(self, list_data):
-        coords, feats, inverse_map, labels, index, region= list(zip(*list_data))
-        coords_batch, feats_batch, inverse_batch, labels_batch = [], [], [], []
-        region_batch = []
-        for batch_id, _ in enumerate(coords):
-            num_points = coords[batch_id].shape[0]
-            coords_batch.append(torch.cat((torch.ones(num_points, 1).int() * batch_id, torch.from_numpy(coords[batch_id]).int()), 1))
-            feats_batch.append(torch.from_numpy(feats[batch_id]))
-            inverse_batch.append(torch.from_numpy(inverse_map[batch_id]))
-            labels_batch.append(torch.from_numpy(labels[batch_id]).int())
-            region_batch.append(torch.from_numpy(region[batch_id])[:,None])
-        #
-        # Concatenate all lists
-        coords_batch = torch.cat(coords_batch, 0).float()
-        feats_batch = torch.cat(feats_batch, 0).float()
-        inverse_batch = torch.cat(inverse_batch, 0).int()
-        labels_batch = torch.cat(labels_batch, 0).int()
-        region_batch = torch.cat(region_batch, 0)
-
-        return coords_batch, feats_batch, inverse_batch, labels_batch, index, region_batch
\ No newline at end of file
+        return tuple(collate_points(list_data, self.layout, self.pin_memory))
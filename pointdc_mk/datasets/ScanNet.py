@@ -1,12 +1,20 @@
 import torch
 import numpy as np
 from lib.helper_ply import read_ply, write_ply
+from lib.scene_store import read_scene
+from lib.scene_cache import SceneCache
+from lib.scene_index import voxel_tag
+from lib.collate import collate_points, COORDS, POINTS, COLUMN, INDS, LIST
+from lib.voxel_cache import VoxelCache, quantize
+from lib.superpoint_utils import compact_superpoints
+from lib.scene_arena import SceneArena, arena_is_current, build_arena
+from lib.manifest import file_signature
+from lib.preload import preload
 from torch.utils.data import Dataset
-import MinkowskiEngine as ME
 import random
 import os
 from tqdm import tqdm
-from lib.aug_tools import rota_coords, scale_coords, trans_coords, elastic_coords
+from lib.aug_tools import affine_coords, elastic_coords
 
 def read_txt(path):
   """Read txt file into lines.
@@ -20,6 +28,8 @@ def read_txt(path):
 class Scannetdistill(Dataset):
     def __init__(self, args):
         self.args = args
+        self.cache = SceneCache(self.args.cache_budget * 1024**3)
+        self.voxel_cache = VoxelCache(self.args.voxel_cache_path, self.cache)
         self.path_file = 'data_prepare/ScanNet_splits/scannetv2_train.txt'
         self.label_to_names = {0: 'wall',
                                1: 'floor',
@@ -52,10 +62,8 @@ class Scannetdistill(Dataset):
         self.preload_data() # 预读取文件到内存，内存不够自行修改
 
         '''Initial Augmentations'''
-        self.trans_coords = trans_coords(shift_ratio=50)  ### 50%
-        self.rota_coords = rota_coords(rotation_bound = ((-np.pi/32, np.pi/32), (-np.pi/32, np.pi/32), (-np.pi, np.pi)))
-        self.scale_coords = scale_coords(scale_bound=(0.9, 1.1))
-        self.elastic_coords = elastic_coords(voxel_size=self.args.voxel_size)
+        self.affine_coords = affine_coords(rotation_bound = ((-np.pi/32, np.pi/32), (-np.pi/32, np.pi/32), (-np.pi, np.pi)), shift_ratio=50, scale_bound=(0.9, 1.1)) ### 50% shift
+        self.elastic_coords = elastic_coords(voxel_size=self.args.voxel_size, fast=self.args.elastic == 'fast', pool_size=self.args.elastic_pool)
 
     def preload_data(self):
         for plyname in self.plypath:
@@ -64,15 +72,32 @@ class Scannetdistill(Dataset):
             self.file.append(file)
             self.feats.append(os.path.join(self.args.feats_path, plyname[0:12]+'_feats.pth'))
 
-        for featpat, filepath in tqdm(zip(self.feats, self.file), desc='Pre Load Datas(1021)'): # 读取数据
-            spfeats, data = torch.load(featpat), read_ply(filepath)
-            self.feats_datas.append(spfeats)
-            self.points_datas.append(data)
+        if self.args.preload == 'arena':
+            self.preload_arena()
+            return
+
+        # 读取数据, scenes past --preload_budget are read in __getitem__
+        budget = None if self.args.preload_budget is None else self.args.preload_budget * 1024**3
+        datas = preload(list(range(len(self.file))), self.load_scene, sources=list(zip(self.feats, self.file)),
+                        workers=self.args.preload_workers, budget=budget, desc='Pre Load Datas(1201)')
+        self.feats_datas = [None if data is None else data[0] for data in datas]
+        self.points_datas = [None if data is None else data[1] for data in datas]
+
+    def load_scene(self, index):
+        return torch.load(self.feats[index]), read_scene(self.file[index])
+
+    def preload_arena(self):
+        '''Pack the scenes once into a memory-mapped arena, sliced zero-copy by every worker'''
+        signatures = [file_signature([p for p in (filepath, featpat) if os.path.exists(p)]) for filepath, featpat in zip(self.file, self.feats)]
+        if not arena_is_current(self.args.arena_path, self.name, signatures):
+            def arena_scene(index):
+                spfeats, (coords, colors, labels) = self.load_scene(index)
+                return {'coords': coords, 'colors': colors, 'labels': labels, 'spfeats': spfeats.cpu().numpy()}
+            build_arena(self.args.arena_path, self.name, signatures, arena_scene, desc='Pack Datas(1201)')
+        self.arena = SceneArena(self.args.arena_path)
 
     def augs(self, coords, feats, elastic=False):
-        coords = self.rota_coords(coords)
-        coords = self.trans_coords(coords)
-        coords = self.scale_coords(coords)
+        coords = self.affine_coords(coords)
 
         if elastic:
             scale = 1 / self.args.voxel_size   
@@ -90,29 +115,47 @@ class Scannetdistill(Dataset):
         feats = np.concatenate((colors, feats), axis=-1)
         return norm_coords, feats, labels
 
-    def voxelize(self, coords, feats, labels):
-        scale = 1 / self.args.voxel_size
-        coords = np.floor(coords * scale)
-        coords, feats, labels, unique_map, inverse_map = ME.utils.sparse_quantize(np.ascontiguousarray(coords), feats, labels=labels, ignore_label=-1, return_index=True, return_inverse=True)
-        return coords.numpy(), feats, labels, unique_map, inverse_map.numpy()
+    def voxelize(self, coords, feats, labels, scene_file=None):
+        voxels = self.voxel_cache.get(scene_file, (self.args.voxel_size, labels is not None), \
+                                      lambda: quantize(coords, self.args.voxel_size, labels))
+        unique_map = voxels['unique_map']
+        return voxels['coords'], feats[unique_map], voxels.get('labels'), unique_map, voxels['inverse_map']
 
     def __len__(self):
         return len(self.file)
 
+    def voxel_tag(self):
+        """Scene index column of the voxel counts of voxel_count"""
+        return voxel_tag(self.args.voxel_size)
+
+    def voxel_count(self, index):
+        """Voxels of a scene, what it weighs in a batch"""
+        if self.args.preload == 'arena':
+            coords, colors, labels = self.arena.scene(index, ['coords', 'colors', 'labels'])
+        elif self.points_datas[index] is not None:
+            coords, colors, labels = self.points_datas[index]
+        else:
+            coords, colors, labels = read_scene(self.file[index])
+        return len(self.voxelize(coords - coords.mean(0), colors, labels, self.file[index])[0])
+
     def __getitem__(self, index):
-        data = self.points_datas[index]
-        coords, colors, labels = np.vstack((data['x'], data['y'], data['z'])).T, np.vstack((data['red'], data['green'], data['blue'])).T, data['class']
+        if self.args.preload == 'arena':
+            coords, colors, labels, spfeats = self.arena.scene(index, ['coords', 'colors', 'labels', 'spfeats'])
+        elif self.points_datas[index] is not None:
+            (coords, colors, labels), spfeats = self.points_datas[index], self.feats_datas[index]
+        else:
+            spfeats, (coords, colors, labels) = self.load_scene(index)
         colors = colors.astype(np.float32)
-        coords = coords.astype(np.float32)
-        coords -= coords.mean(0)
+        coords = coords - coords.mean(0)
+        labels = labels.copy()
      
-        coords, colors, _, unique_map, inverse_map = self.voxelize(coords, colors, labels)
+        coords, colors, _, unique_map, inverse_map = self.voxelize(coords, colors, labels, self.file[index])
         coords = coords.astype(np.float32)
 
         region_file = self.args.sp_path + '/' +self.name[index] + '_superpoint.npy'
-        region = np.load(region_file).astype(np.int64)
+        region = self.cache.load(region_file).astype(np.int64)
 
-        coords, colors = self.augs(coords, colors)
+        coords, colors = self.augs(coords, colors, elastic=self.args.elastic != 'off')
         inds = np.arange(coords.shape[0])
 
         coords, feats, labels = self.augment_coords_to_feats(coords, colors/255-0.5, labels)
@@ -120,8 +163,10 @@ class Scannetdistill(Dataset):
 
         normals = np.zeros_like(coords)  
         pseudo = -np.ones_like(labels).astype(np.long)
-        spfeats = self.feats_datas[index]
-        spfeats = spfeats[unique_map]
+        if self.args.preload == 'arena':
+            spfeats = torch.from_numpy(spfeats[np.asarray(unique_map)])
+        else:
+            spfeats = spfeats[unique_map]
             
         return coords, feats, normals, labels, inverse_map, pseudo, inds, region, index, self.name[index], spfeats
 
@@ -129,6 +174,8 @@ class Scannetdistill(Dataset):
 class Scannettrain(Dataset):
     def __init__(self, args):
         self.args = args
+        self.cache = SceneCache(self.args.cache_budget * 1024**3)
+        self.voxel_cache = VoxelCache(self.args.voxel_cache_path, self.cache)
         self.path_file = 'data_prepare/ScanNet_splits/scannetv2_train.txt'
         self.label_to_names = {0: 'wall',
                                1: 'floor',
@@ -161,15 +208,11 @@ class Scannettrain(Dataset):
             self.file.append(file)
 
         '''Initial Augmentations'''
-        self.trans_coords = trans_coords(shift_ratio=50)  ### 50%
-        self.rota_coords = rota_coords(rotation_bound = ((-np.pi/32, np.pi/32), (-np.pi/32, np.pi/32), (-np.pi, np.pi)))
-        self.scale_coords = scale_coords(scale_bound=(0.9, 1.1))
-        self.elastic_coords = elastic_coords(voxel_size=self.args.voxel_size)
+        self.affine_coords = affine_coords(rotation_bound = ((-np.pi/32, np.pi/32), (-np.pi/32, np.pi/32), (-np.pi, np.pi)), shift_ratio=50, scale_bound=(0.9, 1.1)) ### 50% shift
+        self.elastic_coords = elastic_coords(voxel_size=self.args.voxel_size, fast=self.args.elastic == 'fast', pool_size=self.args.elastic_pool)
 
     def augs(self, coords, feats, elastic=False):
-        coords = self.rota_coords(coords)
-        coords = self.trans_coords(coords)
-        coords = self.scale_coords(coords)
+        coords = self.affine_coords(coords)
 
         if elastic:
             scale = 1 / self.args.voxel_size   
@@ -187,29 +230,36 @@ class Scannettrain(Dataset):
         feats = np.concatenate((colors, feats), axis=-1)
         return norm_coords, feats, labels
 
-    def voxelize(self, coords, feats, labels):
-        scale = 1 / self.args.voxel_size
-        coords = np.floor(coords * scale)
-        coords, feats, labels, unique_map, inverse_map = ME.utils.sparse_quantize(np.ascontiguousarray(coords), feats, labels=labels, ignore_label=-1, return_index=True, return_inverse=True)
-        return coords.numpy(), feats, labels, unique_map, inverse_map.numpy()
+    def voxelize(self, coords, feats, labels, scene_file=None):
+        voxels = self.voxel_cache.get(scene_file, (self.args.voxel_size, labels is not None), \
+                                      lambda: quantize(coords, self.args.voxel_size, labels))
+        unique_map = voxels['unique_map']
+        return voxels['coords'], feats[unique_map], voxels.get('labels'), unique_map, voxels['inverse_map']
 
     def __len__(self):
         return len(self.file)
 
+    def voxel_tag(self):
+        """Scene index column of the voxel counts of voxel_count"""
+        return voxel_tag(self.args.voxel_size)
+
+    def voxel_count(self, index):
+        """Voxels of a scene, what it weighs in a batch"""
+        coords, colors, labels = read_scene(self.file[index])
+        return len(self.voxelize(coords - coords.mean(0), colors, labels, self.file[index])[0])
+
     def __getitem__(self, index):
-        data = read_ply(self.file[index])
-        coords, colors, labels = np.vstack((data['x'], data['y'], data['z'])).T, np.vstack((data['red'], data['green'], data['blue'])).T, data['class']
+        coords, colors, labels = self.cache.read_scene(self.file[index])
         colors = colors.astype(np.float32)
-        coords = coords.astype(np.float32)
         coords -= coords.mean(0)
 
-        coords, colors, _, unique_map, inverse_map = self.voxelize(coords, colors, labels)
+        coords, colors, _, unique_map, inverse_map = self.voxelize(coords, colors, labels, self.file[index])
         coords = coords.astype(np.float32)
 
         region_file = self.args.sp_path + '/' +self.name[index] + '_superpoint.npy'
-        region = np.load(region_file).astype(np.int64)
+        region = self.cache.load(region_file).astype(np.int64)
 
-        coords, colors = self.augs(coords, colors)
+        coords, colors = self.augs(coords, colors, elastic=self.args.elastic != 'off')
         inds = np.arange(coords.shape[0])
 
         coords, feats, labels = self.augment_coords_to_feats(coords, colors/255-0.5, labels)
@@ -236,6 +286,8 @@ class Scannettrain(Dataset):
 class Scannetval(Dataset):
     def __init__(self, args):
         self.args = args
+        self.cache = SceneCache(self.args.cache_budget * 1024**3)
+        self.voxel_cache = VoxelCache(self.args.voxel_cache_path, self.cache)
         self.path_file = 'data_prepare/ScanNet_splits/scannetv2_val.txt'
         self.label_to_names = {0: 'wall',
                                1: 'floor',
@@ -275,130 +327,71 @@ class Scannetval(Dataset):
         feats = np.concatenate((colors, feats), axis=-1)
         return norm_coords, feats, labels
 
-    def voxelize(self, coords, feats, labels):
-        scale = 1 / self.args.voxel_size
-        coords = np.floor(coords * scale)
-        coords, feats, labels, unique_map, inverse_map = ME.utils.sparse_quantize(np.ascontiguousarray(coords), feats, labels=labels, ignore_label=-1, return_index=True, return_inverse=True)
-        return coords.numpy(), feats, labels, unique_map, inverse_map.numpy()
+    def voxelize(self, coords, feats, labels, scene_file=None):
+        voxels = self.voxel_cache.get(scene_file, (self.args.voxel_size, labels is not None), \
+                                      lambda: quantize(coords, self.args.voxel_size, labels))
+        unique_map = voxels['unique_map']
+        return voxels['coords'], feats[unique_map], voxels.get('labels'), unique_map, voxels['inverse_map']
 
     def __len__(self):
         return len(self.file)
 
     def __getitem__(self, index):
-        data = read_ply(self.file[index])
-        coords, colors, labels = np.vstack((data['x'], data['y'], data['z'])).T, np.vstack((data['red'], data['green'], data['blue'])).T, data['class']
+        coords, colors, labels = self.cache.read_scene(self.file[index])
         colors = colors.astype(np.float32)
-        coords = coords.astype(np.float32)
         coords -= coords.mean(0)
 
-        coords, colors, _, unique_map, inverse_map = self.voxelize(coords, colors, labels)
+        coords, colors, _, unique_map, inverse_map = self.voxelize(coords, colors, labels, self.file[index])
         coords = coords.astype(np.float32)
         region_file = self.args.sp_path + '/' +self.name[index] + '_superpoint.npy'
-        region = np.load(region_file)
+        region = self.cache.load(region_file)
 
         labels[labels == self.args.ignore_label] = -1
         region[labels == -1] = -1
         region = region[unique_map]
 
-        valid_region = region[region != -1]
-        unique_vals = np.unique(valid_region)
-        unique_vals.sort()
-        valid_region = np.searchsorted(unique_vals, valid_region)
-
-        region[region != -1] = valid_region
+        region = compact_superpoints(region)
 
         coords, feats, labels = self.augment_coords_to_feats(coords, colors/255-0.5, labels)
         return coords, feats, inverse_map, np.ascontiguousarray(labels), index, region
  
 
 class cfl_collate_fn_distill:
+    # coords, feats, normals, labels, inverse_map, pseudo, inds, region, index, scenenames, spfeats
+    layout = [(COORDS, torch.float32), (POINTS, torch.float32), (POINTS, torch.float32), (POINTS, torch.float32),
+              (POINTS, torch.int32), (POINTS, None), (INDS, torch.int32), (COLUMN, None),
+              (LIST, None), (LIST, None), (POINTS, None)]
+
+    def __init__(self, pin_memory=False):
+        self.pin_memory = pin_memory
 
     def __call__(self, list_data):
-        coords, feats, normals, labels, inverse_map, pseudo, inds, region, index, scenenames, spfeats = list(zip(*list_data))
-        coords_batch, feats_batch, normal_batch, labels_batch, inverse_batch, pseudo_batch, \
-                         inds_batch, spfeats_batch, region_batch = [], [], [], [], [], [], [], [], []
-
-        accm_num = 0
-        for batch_id, _ in enumerate(coords):
-            num_points = coords[batch_id].shape[0]
-            coords_batch.append(torch.cat((torch.ones(num_points, 1).int() * batch_id, torch.from_numpy(coords[batch_id]).int()), 1))
-            feats_batch.append(torch.from_numpy(feats[batch_id]))
-            normal_batch.append(torch.from_numpy(normals[batch_id]))
-            labels_batch.append(torch.from_numpy(labels[batch_id].copy()).int())
-            inverse_batch.append(torch.from_numpy(inverse_map[batch_id]))
-            pseudo_batch.append(torch.from_numpy(pseudo[batch_id]))
-            inds_batch.append(torch.from_numpy(inds[batch_id] + accm_num).int())
-            region_batch.append(torch.from_numpy(region[batch_id])[:,None])
-            spfeats_batch.append(spfeats[batch_id])
-            accm_num += coords[batch_id].shape[0]
-
-        # Concatenate all lists
-        coords_batch = torch.cat(coords_batch, 0).float()#.int()
-        feats_batch = torch.cat(feats_batch, 0).float()
-        normal_batch = torch.cat(normal_batch, 0).float()
-        labels_batch = torch.cat(labels_batch, 0).float()
-        inverse_batch = torch.cat(inverse_batch, 0).int()
-        pseudo_batch = torch.cat(pseudo_batch, -1)
-        inds_batch = torch.cat(inds_batch, 0)
-        region_batch = torch.cat(region_batch, 0)
-        spfeats_batch = torch.cat(spfeats_batch, 0)
-
-        return coords_batch, feats_batch, normal_batch, labels_batch, inverse_batch, pseudo_batch, \
-                        inds_batch, region_batch, index, scenenames, spfeats_batch
+        return tuple(collate_points(list_data, self.layout, self.pin_memory))
+
 
 class cfl_collate_fn:
+    # coords, feats, normals, labels, inverse_map, pseudo, inds, region, index, scenenames
+    layout = [(COORDS, torch.float32), (POINTS, torch.float32), (POINTS, torch.float32), (POINTS, torch.float32),
+              (POINTS, torch.int32), (POINTS, None), (INDS, torch.int32), (COLUMN, None),
+              (LIST, None), (LIST, None)]
+
+    def __init__(self, pin_memory=False):
+        self.pin_memory = pin_memory
 
     def __call__(self, list_data):
-        coords, feats, normals, labels, inverse_map, pseudo, inds, region, index, scenenames = list(zip(*list_data))
-        coords_batch, feats_batch, normal_batch, labels_batch, inverse_batch, pseudo_batch, inds_batch = [], [], [], [], [], [], []
-        region_batch = []
-        accm_num = 0
-        for batch_id, _ in enumerate(coords):
-            num_points = coords[batch_id].shape[0]
-            coords_batch.append(torch.cat((torch.ones(num_points, 1).int() * batch_id, torch.from_numpy(coords[batch_id]).int()), 1))
-            feats_batch.append(torch.from_numpy(feats[batch_id]))
-            normal_batch.append(torch.from_numpy(normals[batch_id]))
-            labels_batch.append(torch.from_numpy(labels[batch_id].copy()).int())
-            inverse_batch.append(torch.from_numpy(inverse_map[batch_id]))
-            pseudo_batch.append(torch.from_numpy(pseudo[batch_id]))
-            inds_batch.append(torch.from_numpy(inds[batch_id] + accm_num).int())
-            region_batch.append(torch.from_numpy(region[batch_id])[:,None])
-            accm_num += coords[batch_id].shape[0]
-
-        # Concatenate all lists
-        coords_batch = torch.cat(coords_batch, 0).float()#.int()
-        feats_batch = torch.cat(feats_batch, 0).float()
-        normal_batch = torch.cat(normal_batch, 0).float()
-        labels_batch = torch.cat(labels_batch, 0).float()
-        inverse_batch = torch.cat(inverse_batch, 0).int()
-        pseudo_batch = torch.cat(pseudo_batch, -1)
-        inds_batch = torch.cat(inds_batch, 0)
-        region_batch = torch.cat(region_batch, 0)
-
-        return coords_batch, feats_batch, normal_batch, labels_batch, inverse_batch, pseudo_batch, inds_batch, region_batch, index, scenenames
+        return tuple(collate_points(list_data, self.layout, self.pin_memory))
+
 
 
 
 class cfl_collate_fn_val:
+    # coords, feats, inverse_map, labels, index, region
+    layout = [(COORDS, torch.float32), (POINTS, torch.float32), (POINTS, torch.int32), (POINTS, torch.int32),
+              (LIST, None), (COLUMN, None)]
+
+    def __init__(self, pin_memory=False):
+        self.pin_memory = pin_memory
 
     def __call__(self, list_data):
-        coords, feats, inverse_map, labels, index, region = list(zip(*list_data))
-        coords_batch, feats_batch, inverse_batch, labels_batch = [], [], [], []
-        region_batch = []
-        for batch_id, _ in enumerate(coords):
-            num_points = coords[batch_id].shape[0]
-            coords_batch.append(
-                torch.cat((torch.ones(num_points, 1).int() * batch_id, torch.from_numpy(coords[batch_id]).int()), 1))
-            feats_batch.append(torch.from_numpy(feats[batch_id]))
-            inverse_batch.append(torch.from_numpy(inverse_map[batch_id]))
-            labels_batch.append(torch.from_numpy(labels[batch_id]).int())
-            region_batch.append(torch.from_numpy(region[batch_id])[:, None])
-        #
-        # Concatenate all lists
-        coords_batch = torch.cat(coords_batch, 0).float()
-        feats_batch = torch.cat(feats_batch, 0).float()
-        inverse_batch = torch.cat(inverse_batch, 0).int()
-        labels_batch = torch.cat(labels_batch, 0).int()
-        region_batch = torch.cat(region_batch, 0)
-
-        return coords_batch, feats_batch, inverse_batch, labels_batch, index, region_batch
+        return tuple(collate_points(list_data, self.layout, self.pin_memory))
+
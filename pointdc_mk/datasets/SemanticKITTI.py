@@ -1,43 +1,30 @@
 import torch
 import numpy as np
 from lib.helper_ply import read_ply, write_ply
+from lib.scene_store import read_scene
+from lib.scene_cache import SceneCache
+from lib.scene_index import voxel_tag
+from lib.collate import collate_points, COORDS, POINTS, COLUMN, INDS, LIST
+from lib.superpoint_utils import drop_superpoints
+from lib.voxel_cache import VoxelCache, quantize
 from torch.utils.data import Dataset
-import MinkowskiEngine as ME
 import random
 import os
 import open3d as o3d
-from lib.aug_tools import rota_coords, scale_coords, trans_coords
+from lib.aug_tools import affine_coords
 
 class cfl_collate_fn:
+    # coords, feats, normals, labels, inverse_map, pseudo, inds, region, index
+    layout = [(COORDS, torch.float32), (POINTS, torch.float32), (POINTS, torch.float32), (POINTS, torch.float32),
+              (POINTS, torch.int32), (POINTS, None), (INDS, torch.int32), (COLUMN, None),
+              (LIST, None)]
+
+    def __init__(self, pin_memory=False):
+        self.pin_memory = pin_memory
 
     def __call__(self, list_data):
-        coords, feats, normals, labels, inverse_map, pseudo, inds, region, index = list(zip(*list_data))
-        coords_batch, feats_batch, normal_batch, labels_batch, inverse_batch, pseudo_batch, inds_batch = [], [], [], [], [], [], []
-        region_batch = []
-        accm_num = 0
-        for batch_id, _ in enumerate(coords):
-            num_points = coords[batch_id].shape[0]
-            coords_batch.append(torch.cat((torch.ones(num_points, 1).int() * batch_id, torch.from_numpy(coords[batch_id]).int()), 1))
-            feats_batch.append(torch.from_numpy(feats[batch_id]))
-            normal_batch.append(torch.from_numpy(normals[batch_id]))
-            labels_batch.append(torch.from_numpy(labels[batch_id]).int())
-            inverse_batch.append(torch.from_numpy(inverse_map[batch_id]))
-            pseudo_batch.append(torch.from_numpy(pseudo[batch_id]))
-            inds_batch.append(torch.from_numpy(inds[batch_id] + accm_num).int())
-            region_batch.append(torch.from_numpy(region[batch_id])[:,None])
-            accm_num += coords[batch_id].shape[0]
-
-        # Concatenate all lists
-        coords_batch = torch.cat(coords_batch, 0).float()#.int()
-        feats_batch = torch.cat(feats_batch, 0).float()
-        normal_batch = torch.cat(normal_batch, 0).float()
-        labels_batch = torch.cat(labels_batch, 0).float()
-        inverse_batch = torch.cat(inverse_batch, 0).int()
-        pseudo_batch = torch.cat(pseudo_batch, -1)
-        inds_batch = torch.cat(inds_batch, 0)
-        region_batch = torch.cat(region_batch, 0)
-
-        return coords_batch, feats_batch, normal_batch, labels_batch, inverse_batch, pseudo_batch, inds_batch, region_batch, index
+        return tuple(collate_points(list_data, self.layout, self.pin_memory))
+
 
 
 
@@ -45,6 +32,8 @@ class cfl_collate_fn:
 class KITTItrain(Dataset):
     def __init__(self, args, scene_idx, split='train'):
         self.args = args
+        self.cache = SceneCache(self.args.cache_budget * 1024**3)
+        self.voxel_cache = VoxelCache(self.args.voxel_cache_path, self.cache)
         self.label_to_names = {0: 'unlabeled',
                                1: 'car',
                                2: 'bicycle',
@@ -85,9 +74,7 @@ class KITTItrain(Dataset):
                     scene_idx = range(len(self.file))
 
         '''Initial Augmentations'''
-        self.trans_coords = trans_coords(shift_ratio=50)  ### 50%
-        self.rota_coords = rota_coords(rotation_bound = ((-np.pi/32, np.pi/32), (-np.pi/32, np.pi/32), (-np.pi, np.pi)))
-        self.scale_coords = scale_coords(scale_bound=(0.9, 1.1))
+        self.affine_coords = affine_coords(rotation_bound = ((-np.pi/32, np.pi/32), (-np.pi/32, np.pi/32), (-np.pi, np.pi)), shift_ratio=50, scale_bound=(0.9, 1.1)) ### 50% shift
 
         self.random_select_sample(scene_idx)
 
@@ -100,9 +87,7 @@ class KITTItrain(Dataset):
 
 
     def augs(self, coords):
-        coords = self.rota_coords(coords)
-        coords = self.trans_coords(coords)
-        coords = self.scale_coords(coords)
+        coords = self.affine_coords(coords)
         return coords
 
 
@@ -112,33 +97,41 @@ class KITTItrain(Dataset):
         norm_coords = (coords - coords_center)
         return norm_coords, feats, labels
 
-    def voxelize(self, coords, feats, labels):
-        scale = 1 / self.args.voxel_size
-        coords = np.floor(coords * scale)
-        coords, feats, labels, unique_map, inverse_map = ME.utils.sparse_quantize(np.ascontiguousarray(coords), feats, labels=labels, ignore_label=-1, return_index=True, return_inverse=True)
-        return coords.numpy(), feats, labels, unique_map, inverse_map.numpy()
+    def voxelize(self, coords, feats, labels, scene_file=None):
+        voxels = self.voxel_cache.get(scene_file, (self.args.voxel_size, labels is not None), \
+                                      lambda: quantize(coords, self.args.voxel_size, labels))
+        unique_map = voxels['unique_map']
+        return voxels['coords'], feats[unique_map], voxels.get('labels'), unique_map, voxels['inverse_map']
 
 
     def __len__(self):
         return len(self.file_selected)
 
+    def voxel_tag(self):
+        """Scene index column of the voxel counts of voxel_count"""
+        return voxel_tag(self.args.voxel_size, r_crop=self.args.r_crop)
+
+    def voxel_count(self, index):
+        """Voxels of a scene within r_crop, what it weighs in a batch without the scene mixed into it"""
+        file = self.file_selected[index]
+        coords, feats, labels = read_scene(file, fields=['coords', 'remission', 'labels'])
+        coords = self.voxelize(coords - coords.mean(0), feats[:, np.newaxis], labels, file)[0].astype(np.float32)
+        return int((np.sqrt(((coords*self.args.voxel_size)**2).sum(-1)) < self.args.r_crop).sum())
+
     def __getitem__(self, index):
         file = self.file_selected[index]
-        data = read_ply(file)
-        coords = np.array([data['x'], data['y'], data['z']], dtype=np.float32).T
-        feats = np.array(data['remission'])[:, np.newaxis]
-        labels = np.array(data['class'])
-        coords = coords.astype(np.float32)
+        coords, feats, labels = self.cache.read_scene(file, fields=['coords', 'remission', 'labels'])
+        feats = feats[:, np.newaxis]
         coords -= coords.mean(0)
 
-        coords, feats, labels, unique_map, inverse_map = self.voxelize(coords, feats, labels)
+        coords, feats, labels, unique_map, inverse_map = self.voxelize(coords, feats, labels, file)
         coords = coords.astype(np.float32)
 
         mask = np.sqrt(((coords*self.args.voxel_size)**2).sum(-1))< self.args.r_crop
         coords, feats, labels = coords[mask], feats[mask], labels[mask]
 
         region_file = self.args.sp_path + '/' +self.name[index] + '_superpoint.npy'
-        region = np.load(region_file)
+        region = self.cache.load(region_file)
         region = region[unique_map]
         region = region[mask]
 
@@ -148,15 +141,11 @@ class KITTItrain(Dataset):
         inds = np.arange(coords.shape[0])
         mix = random.randint(0, len(self.name)-1)
 
-        data_mix = read_ply(self.file_selected[mix])
-        coords_mix = np.array([data_mix['x'], data_mix['y'], data_mix['z']], dtype=np.float32).T
-        feats_mix = np.array(data_mix['remission'])[:, np.newaxis]
-        labels_mix = np.array(data_mix['class'])
-        feats_mix = feats_mix.astype(np.float32)
-        coords_mix = coords_mix.astype(np.float32)
+        coords_mix, feats_mix, labels_mix = self.cache.read_scene(self.file_selected[mix], fields=['coords', 'remission', 'labels'])
+        feats_mix = feats_mix[:, np.newaxis]
         coords_mix -= coords_mix.mean(0)
 
-        coords_mix, feats_mix, _, unique_map_mix, _ = self.voxelize(coords_mix, feats_mix, labels_mix)
+        coords_mix, feats_mix, _, unique_map_mix, _ = self.voxelize(coords_mix, feats_mix, labels_mix, self.file_selected[mix])
         coords_mix = coords_mix.astype(np.float32)
 
         mask_mix = np.sqrt(((coords_mix * self.args.voxel_size) ** 2).sum(-1)) < self.args.r_crop
@@ -176,19 +165,9 @@ class KITTItrain(Dataset):
             pcd.estimate_normals(search_param=o3d.geometry.KDTreeSearchParamHybrid(radius=10, max_nn=30))
             normals = np.array(pcd.normals)
 
-            region[labels==-1] = -1
-
-            for q in np.unique(region):
-                mask = q == region
-                if mask.sum() < self.args.drop_threshold and q != -1:
-                    region[mask] = -1
-
-            valid_region = region[region != -1]
-            unique_vals = np.unique(valid_region)
-            unique_vals.sort()
-            valid_region = np.searchsorted(unique_vals, valid_region)
-
-            region[region != -1] = valid_region
+            # the same for a scene at every clustering round
+            region = self.cache.get(('dropped superpoints', file, self.args.voxel_size, self.args.r_crop, self.args.drop_threshold), \
+                                    lambda: drop_superpoints(np.where(labels == -1, -1, region), self.args.drop_threshold))
 
             pseudo = -np.ones_like(labels).astype(np.long)
 
@@ -206,6 +185,8 @@ class KITTItrain(Dataset):
 class KITTIval(Dataset):
     def __init__(self, args, split='val'):
         self.args = args
+        self.cache = SceneCache(self.args.cache_budget * 1024**3)
+        self.voxel_cache = VoxelCache(self.args.voxel_cache_path, self.cache)
         self.label_to_names = {0: 'unlabeled',
                                1: 'car',
                                2: 'bicycle',
@@ -248,11 +229,11 @@ class KITTIval(Dataset):
         norm_coords = (coords - coords_center)
         return norm_coords, feats, labels
 
-    def voxelize(self, coords, feats, labels):
-        scale = 1 / self.args.voxel_size
-        coords = np.floor(coords * scale)
-        coords, feats, labels, unique_map, inverse_map = ME.utils.sparse_quantize(np.ascontiguousarray(coords), feats, labels=labels, ignore_label=-1, return_index=True, return_inverse=True)
-        return coords.numpy(), feats, labels, unique_map, inverse_map.numpy()
+    def voxelize(self, coords, feats, labels, scene_file=None):
+        voxels = self.voxel_cache.get(scene_file, (self.args.voxel_size, labels is not None), \
+                                      lambda: quantize(coords, self.args.voxel_size, labels))
+        unique_map = voxels['unique_map']
+        return voxels['coords'], feats[unique_map], voxels.get('labels'), unique_map, voxels['inverse_map']
 
 
     def __len__(self):
@@ -260,18 +241,15 @@ class KITTIval(Dataset):
 
     def __getitem__(self, index):
         file = self.file[index]
-        data = read_ply(file)
-        coords = np.array([data['x'], data['y'], data['z']], dtype=np.float32).T
-        feats = np.array(data['remission'])[:, np.newaxis]
-        labels = np.array(data['class'])
-        coords = coords.astype(np.float32)
+        coords, feats, labels = self.cache.read_scene(file, fields=['coords', 'remission', 'labels'])
+        feats = feats[:, np.newaxis]
         coords -= coords.mean(0)
 
-        coords, feats, _, unique_map, inverse_map = self.voxelize(coords, feats, labels)
+        coords, feats, _, unique_map, inverse_map = self.voxelize(coords, feats, labels, file)
         coords = coords.astype(np.float32)
 
         region_file = self.args.sp_path + '/' +self.name[index] + '_superpoint.npy'
-        region = np.load(region_file)
+        region = self.cache.load(region_file)
         region = region[unique_map]
 
         coords, feats, labels = self.augment_coords_to_feats(coords, feats, labels)
@@ -281,25 +259,14 @@ class KITTIval(Dataset):
 
 
 class cfl_collate_fn_val:
+    # coords, feats, labels, inverse_map, region, index
+    layout = [(COORDS, torch.float32), (POINTS, torch.float32), (POINTS, torch.int32), (POINTS, torch.int32),
+              (COLUMN, None), (LIST, None)]
+
+    def __init__(self, pin_memory=False):
+        self.pin_memory = pin_memory
 
     def __call__(self, list_data):
-        coords, feats, labels, inverse_map, region, index = list(zip(*list_data))
-        coords_batch, feats_batch, inverse_batch, labels_batch = [], [], [], []
-        region_batch = []
-        for batch_id, _ in enumerate(coords):
-            num_points = coords[batch_id].shape[0]
-            coords_batch.append(
-                torch.cat((torch.ones(num_points, 1).int() * batch_id, torch.from_numpy(coords[batch_id]).int()), 1))
-            feats_batch.append(torch.from_numpy(feats[batch_id]))
-            inverse_batch.append(torch.from_numpy(inverse_map[batch_id]))
-            labels_batch.append(torch.from_numpy(labels[batch_id]).int())
-            region_batch.append(torch.from_numpy(region[batch_id])[:, None])
-        #
-        # Concatenate all lists
-        coords_batch = torch.cat(coords_batch, 0).float()
-        feats_batch = torch.cat(feats_batch, 0).float()
-        inverse_batch = torch.cat(inverse_batch, 0).int()
-        labels_batch = torch.cat(labels_batch, 0).int()
-        region_batch = torch.cat(region_batch, 0)
-
-        return coords_batch, feats_batch, inverse_batch, labels_batch, index, region_batch
+        coords, feats, labels, inverse_map, region, index = collate_points(list_data, self.layout, self.pin_memory)
+        return coords, feats, inverse_map, labels, index, region
+
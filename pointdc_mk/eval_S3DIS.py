@@ -1,5 +1,6 @@
 import torch, os, argparse, faiss
 import torch.nn.functional as F
+from torch_scatter import scatter
 from datasets.S3DIS import S3DIStest, S3DIStrain, cfl_collate_fn_test, cfl_collate_fn
 import numpy as np
 import MinkowskiEngine as ME
@@ -27,6 +28,8 @@ def parse_args():
     parser.add_argument('--conv1_kernel_size', type=int, default=5, help='kernel size of 1st conv layers')
     ###
     parser.add_argument('--workers', type=int, default=8, help='how many workers for loading data')
+    parser.add_argument('--cache_budget', type=float, default=0, help='GB of decoded scenes cached by each loading worker, 0 disables the cache')
+    parser.add_argument('--voxel_cache_path', type=str, default=None, help='directory the voxelizations of the scenes are cached in, None keeps them in memory only')
     parser.add_argument('--seed', type=int, default=2023, help='random seed')
     parser.add_argument('--log-interval', type=int, default=150, help='log interval')
     parser.add_argument('--batch_size', type=int, default=8, help='batchsize in training')
@@ -57,22 +60,15 @@ def eval_once(args, model, test_loader, classifier, use_sp=False):
 
             region = region.squeeze()
             if use_sp:
-                region_inds = torch.unique(region).long()
-                region_feats = []
-                for id in region_inds:
-                    if id != -1:
-                        valid_mask = id == region
-                        region_feats.append(feats_norm[valid_mask].mean(0, keepdim=True))
-                region_feats = torch.cat(region_feats, dim=0)
-
                 scores = F.linear(F.normalize(feats_norm), F.normalize(classifier.weight))
                 preds = torch.argmax(scores, dim=1).cpu()
-                
+
+                # Pool every superpoint at once, points outside superpoints keep their own prediction
+                valid_mask = region != -1
+                valid_region = region[valid_mask].long()
+                region_feats = scatter(feats_norm[valid_mask.cuda()], valid_region.cuda(), dim=0, reduce='mean')
                 region_scores = F.linear(F.normalize(region_feats), F.normalize(classifier.weight))
-                for id in region_inds: # 遇到0跳过
-                    if id != 0:
-                        valid_mask = id == region
-                        preds[valid_mask] = torch.argmax(region_scores, dim=1).cpu()[id]
+                preds[valid_mask] = torch.argmax(region_scores, dim=1).cpu()[valid_region]
             else:
                 scores = F.linear(F.normalize(feats_nonorm), F.normalize(classifier.weight))
                 preds = torch.argmax(scores, dim=1).cpu()
@@ -1,5 +1,6 @@
 import torch, os, argparse, faiss
 import torch.nn.functional as F
+from torch_scatter import scatter
 from datasets.ScanNet import Scannetval, cfl_collate_fn_val
 import numpy as np
 import MinkowskiEngine as ME
@@ -30,8 +31,12 @@ def parse_args():
     parser.add_argument('--conv1_kernel_size', type=int, default=5, help='kernel size of 1st conv layers')
     ####
     parser.add_argument('--workers', type=int, default=10, help='how many workers for loading data')
+    parser.add_argument('--cache_budget', type=float, default=0, help='GB of decoded scenes cached by each loading worker, 0 disables the cache')
+    parser.add_argument('--voxel_cache_path', type=str, default=None, help='directory the voxelizations of the scenes are cached in, None keeps them in memory only')
     parser.add_argument('--seed', type=int, default=2023, help='random seed')
     parser.add_argument('--voxel_size', type=float, default=0.02, help='voxel size in SparseConv')
+    parser.add_argument('--elastic', type=str, default='off', choices=['off', 'exact', 'fast'], help='elastic distortion of the training scenes, fast blurs and interpolates the noise with 1-D filters')
+    parser.add_argument('--elastic_pool', type=int, default=0, help='blurred noise fields reused by fast elastic distortion, 0 draws new ones for every scene')
     parser.add_argument('--input_dim', type=int, default=6, help='network input dimension')### 6 for XYZGB
     parser.add_argument('--primitive_num', type=int, default=30, help='how many primitives used in training')
     parser.add_argument('--semantic_class', type=int, default=20, help='ground truth semantic class')
@@ -55,24 +60,15 @@ def eval_once(args, model, test_loader, classifier, use_sp=False):
 
             region = region.squeeze()
             if use_sp:
-                region_inds = torch.unique(region)
-                region_feats = []
-                for id in region_inds:
-                    if id != -1:
-                        valid_mask = id == region
-                        region_feats.append(feats_norm[valid_mask].mean(0, keepdim=True))
-                region_feats = torch.cat(region_feats, dim=0)
-
                 scores = F.linear(F.normalize(feats_norm), F.normalize(classifier.weight))
                 preds = torch.argmax(scores, dim=1).cpu()
-                
+
+                # Pool every superpoint at once, points outside superpoints keep their own prediction
+                valid_mask = region != -1
+                valid_region = region[valid_mask].long()
+                region_feats = scatter(feats_norm[valid_mask.cuda()], valid_region.cuda(), dim=0, reduce='mean')
                 region_scores = F.linear(F.normalize(region_feats), F.normalize(classifier.weight))
-                region_no = 0
-                for id in region_inds:
-                    if id != -1:
-                        valid_mask = id == region
-                        preds[valid_mask] = torch.argmax(region_scores, dim=1).cpu()[region_no]
-                        region_no +=1
+                preds[valid_mask] = torch.argmax(region_scores, dim=1).cpu()[valid_region]
             else:
                 scores = F.linear(F.normalize(feats_nonorm), F.normalize(classifier.weight))
                 preds = torch.argmax(scores, dim=1).cpu()
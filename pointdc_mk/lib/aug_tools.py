@@ -1,9 +1,13 @@
 import numpy as np
-from scipy.linalg import expm, norm
+import torch
+from scipy.linalg import norm
 import scipy.ndimage
+import scipy.interpolate
 
 def M(axis, theta):
-  return expm(np.cross(np.eye(3), axis / norm(axis) * theta))
+  """Rotation of theta around axis, Rodrigues' closed form of expm(cross(eye, axis * theta))"""
+  k = np.cross(np.eye(3), axis / norm(axis))
+  return np.eye(3) + np.sin(theta) * k + (1 - np.cos(theta)) * (k @ k)
 
 
 class trans_coords:
@@ -20,6 +24,10 @@ class rota_coords:
         self.rotation_bound = rotation_bound
 
     def __call__(self, coords):
+        return coords.dot(self.sample())
+
+    def sample(self):
+        """Random rotation matrix"""
         rot_mats = []
         for axis_ind, rot_bound in enumerate(self.rotation_bound):
             theta = 0
@@ -30,8 +38,7 @@ class rota_coords:
             rot_mats.append(M(axis, theta))
         # Use random order
         np.random.shuffle(rot_mats)
-        rot_mat = rot_mats[0] @ rot_mats[1] @ rot_mats[2]
-        return coords.dot(rot_mat)
+        return rot_mats[0] @ rot_mats[1] @ rot_mats[2]
 
 
 class scale_coords:
@@ -41,12 +48,75 @@ class scale_coords:
     def __call__(self, coords):
         scale = np.random.uniform(*self.scale_bound)
         return coords*scale
-    
+
+
+class affine_coords:
+    """
+    rota_coords, trans_coords then scale_coords composed into one affine map, coords @ A + b, applied to the
+    points in a single matmul instead of three passes. The parameters are drawn in the same order as the three
+    steps, a seeded run yields the same augmentations.
+    """
+    def __init__(self, rotation_bound=((-np.pi/32, np.pi/32), (-np.pi/32, np.pi/32), (-np.pi, np.pi)), shift_ratio=50, scale_bound=(0.9, 1.1)):
+        self.rota_coords = rota_coords(rotation_bound)
+        self.ratio = shift_ratio
+        self.scale_bound = scale_bound
+
+    def sample(self):
+        """A (3, 3) and b (3,) of one random transform"""
+        rot_mat = self.rota_coords.sample()
+        shift = np.random.uniform(0, 1, 3) * self.ratio
+        scale = np.random.uniform(*self.scale_bound)
+        # ((coords @ R) + shift) * scale
+        return rot_mat * scale, shift * scale
+
+    def __call__(self, coords):
+        mat, shift = self.sample()
+        return coords @ mat + shift
+
+    def batch(self, coords):
+        """
+        Torch variant for a collated batch, one random transform per sample
+
+        Parameters
+        ----------
+        coords: (N, 4) tensor of batch index and xyz, as built by the collate functions
+
+        Returns
+        -------
+        coords: (N, 4) tensor, batch index kept and xyz transformed
+        """
+        batch_ids = coords[:, 0].long()
+        mats, shifts = zip(*[self.sample() for _ in range(int(batch_ids.max()) + 1)])
+        mats = torch.as_tensor(np.stack(mats), dtype=coords.dtype, device=coords.device)
+        shifts = torch.as_tensor(np.stack(shifts), dtype=coords.dtype, device=coords.device)
+        xyz = torch.bmm(coords[:, None, 1:], mats[batch_ids]).squeeze(1) + shifts[batch_ids]
+        return torch.cat((coords[:, :1], xyz), 1)
+
+
 class elastic_coords:
-    def __init__(self, voxel_size):
+    """
+    Elastic distortion of coordinates by blurred noise displacement fields
+
+    Parameters
+    ----------
+    voxel_size: size of the voxels the coordinates are counted in
+    fast: blur with separable 1-D box filters and look the three displacements up in one map_coordinates
+        call, instead of 3-D convolutions and one RegularGridInterpolator per channel
+    pool_size: in fast mode, number of blurred noise fields kept per granularity and reused with random
+        offsets, 0 draws a new field at every call
+    """
+    def __init__(self, voxel_size, fast=False, pool_size=0):
         self.voxel_size = voxel_size
-        
+        self.fast = fast
+        self.pool_size = pool_size
+        self.pools = {}
+
     def __call__(self, coords, gran, mag):
+        if self.fast:
+            bb = (np.abs(coords).max(0).astype(np.int32) // gran + 3).astype(np.int32)
+            noise = self.pooled_noise(gran, bb) if self.pool_size > 0 else self.noise(bb)
+            return coords + self.displacements(coords, noise, gran) * mag
+
         blur0 = np.ones((3, 1, 1)).astype('float32') / 3
         blur1 = np.ones((1, 3, 1)).astype('float32') / 3
         blur2 = np.ones((1, 1, 3)).astype('float32') / 3
@@ -65,4 +135,33 @@ class elastic_coords:
         def g(x_):
             return np.hstack([i(x_)[:, None] for i in interp])
 
-        return coords + g(coords) * mag
\ No newline at end of file
+        return coords + g(coords) * mag
+
+    def noise(self, shape):
+        """(3,) + shape blurred noise, the box blurs of __call__ as 1-D passes over the three channels at once"""
+        noise = np.random.randn(3, *shape).astype('float32')
+        for _ in range(2):
+            for axis in (1, 2, 3):
+                noise = scipy.ndimage.uniform_filter1d(noise, 3, axis=axis, mode='constant', cval=0)
+        return noise
+
+    def pooled_noise(self, gran, shape):
+        """Random window of a pooled noise field, the field is drawn again (twice larger) when too small"""
+        pool = self.pools.setdefault(gran, [])
+        k = np.random.randint(self.pool_size)
+        if k >= len(pool):
+            pool.append(self.noise(2 * shape))
+            k = len(pool) - 1
+        elif np.any(np.array(pool[k].shape[1:]) < shape):
+            pool[k] = self.noise(np.maximum(np.array(pool[k].shape[1:]), 2 * shape))
+        offset = [np.random.randint(n - b + 1) for n, b in zip(pool[k].shape[1:], shape)]
+        return pool[k][:, offset[0]:offset[0] + shape[0], offset[1]:offset[1] + shape[1], offset[2]:offset[2] + shape[2]]
+
+    @staticmethod
+    def displacements(coords, noise, gran):
+        """Trilinear lookup of the (3, bx, by, bz) noise at coords, on the grid of __call__ (nodes 2 * gran apart)"""
+        bb = np.array(noise.shape[1:])
+        # grid indices computed once for the three channels, one 3-D lookup per channel is twice faster
+        # than a single 4-D lookup, which would interpolate along the channels too
+        lookup = ((coords + (bb - 1) * gran) / (2 * gran)).T
+        return np.stack([scipy.ndimage.map_coordinates(n, lookup, order=1, mode='constant', cval=0) for n in noise], 1)
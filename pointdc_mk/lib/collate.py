@@ -0,0 +1,74 @@
+'''
+Collate engine of the cfl_collate_fn classes. The sizes of the batch are computed first and every field is
+written once into its own preallocated (optionally pinned) tensor, instead of converting each sample to a
+tensor, casting it, and concatenating the lists.
+'''
+import numpy as np
+import torch
+
+COORDS, POINTS, COLUMN, INDS, LIST = 'coords', 'points', 'column', 'inds', 'list'
+
+
+def torch_dtype(value):
+    if torch.is_tensor(value):
+        return value.dtype
+    return torch.from_numpy(np.empty(0, dtype=value.dtype)).dtype
+
+
+def fill(out, value):
+    """Copy a sample into its rows of the batch, casting it on the way (float to int truncates, as .int())"""
+    if torch.is_tensor(value):
+        out.copy_(value)
+    else:
+        np.copyto(out.numpy(), value, casting='unsafe')
+
+
+def collate_points(list_data, layout, pin_memory=False):
+    """
+    Parameters
+    ----------
+    list_data: samples, tuples of arrays (numpy or torch) of points and of other values. The first field
+        is the coordinates.
+    layout: one (kind, dtype) per field of the samples, dtype None keeps the dtype of the samples
+        COORDS: (N, 1 + D) batch index then coordinates truncated to integers, as float
+        POINTS: concatenated along the points
+        COLUMN: concatenated along the points as a (N, 1) column
+        INDS:   concatenated along the points, shifted by the number of points of the previous samples
+        LIST:   tuple of the values of the samples
+    pin_memory: allocate the batch in pinned memory, only from the main process
+
+    Returns
+    -------
+    batch: one entry per field
+    """
+    fields = list(zip(*list_data))
+    offsets = np.cumsum([0] + [len(coords) for coords in fields[0]])
+    batch = []
+    for (kind, dtype), values in zip(layout, fields):
+        if kind == LIST:
+            batch.append(values)
+            continue
+        dtype = torch_dtype(values[0]) if dtype is None else dtype
+        starts = np.cumsum([0] + [len(value) for value in values])
+        tail = tuple(values[0].shape[1:])
+
+        if kind == COORDS:
+            # coordinates are truncated to integers first, as the network has always been fed
+            coords = torch.empty((starts[-1],) + tail, dtype=torch.int32)
+            for i, value in enumerate(values):
+                fill(coords[starts[i]:starts[i + 1]], value)
+            out = torch.empty((starts[-1], 1 + tail[0]), dtype=dtype, pin_memory=pin_memory)
+            out[:, 0] = torch.repeat_interleave(torch.arange(len(values), dtype=dtype), torch.from_numpy(np.diff(starts)))
+            out[:, 1:] = coords
+        elif kind == COLUMN:
+            out = torch.empty((starts[-1], 1) + tail, dtype=dtype, pin_memory=pin_memory)
+            for i, value in enumerate(values):
+                fill(out[starts[i]:starts[i + 1], 0], value)
+        else:
+            out = torch.empty((starts[-1],) + tail, dtype=dtype, pin_memory=pin_memory)
+            for i, value in enumerate(values):
+                fill(out[starts[i]:starts[i + 1]], value)
+                if kind == INDS:
+                    out[starts[i]:starts[i + 1]] += int(offsets[i])
+        batch.append(out)
+    return batch
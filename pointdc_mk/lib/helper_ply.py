@@ -25,6 +25,7 @@
 # Basic libs
 import numpy as np
 import sys
+import os
 
 
 # Define PLY types
@@ -113,7 +114,121 @@ def parse_mesh_header(plyfile, ext):
     return num_points, num_faces, vertex_properties
 
 
-def read_ply(filename, triangular_mesh=False):
+def read_vertex_body(plyfile, filename, properties, num_points, mmap):
+    """ Read the vertex element starting at the current position of plyfile, either into memory or as 
+    a copy-on-write memory map. The file position is left at the end of the vertex element.
+    """
+    if mmap and num_points:
+        data = np.memmap(filename, dtype=properties, mode='c', offset=plyfile.tell(), shape=(num_points,))
+        plyfile.seek(data.dtype.itemsize * num_points, 1)
+    else:
+        data = np.fromfile(plyfile, dtype=properties, count=num_points)
+    return data
+
+
+def project_fields(data, fields, dtypes=None):
+    """ Decode some properties of a structured vertex array into plain arrays
+
+    Parameters
+    ----------
+    data: structured array (or memmap) returned by the vertex reader
+    fields: list of property names or lists of property names. A name gives a 1D array, a list of 
+        names gives a 2D array with one column per property.
+    dtypes: list of output dtypes, one per entry of fields. None keeps the dtype of the (first) 
+        property.
+
+    Returns
+    -------
+    arrays: list[np.ndarray]
+    """
+    if dtypes is None:
+        dtypes = [None] * len(fields)
+
+    arrays = []
+    for names, dtype in zip(fields, dtypes):
+        if isinstance(names, str):
+            array = np.empty(data.shape[0], dtype=dtype or data.dtype[names])
+            array[:] = data[names]
+        else:
+            array = np.empty((data.shape[0], len(names)), dtype=dtype or data.dtype[names[0]])
+            # Each property is a strided slice of the record, cast straight into its column
+            for i, name in enumerate(names):
+                array[:, i] = data[name]
+        arrays.append(array)
+    return arrays
+
+
+def ascii_cache_path(filename):
+    """ Binary sidecar of an ascii ".ply" file, in a hidden folder next to it so that globs on the 
+    dataset folder do not pick it up
+    """
+    filename = str(filename)
+    return os.path.join(os.path.dirname(filename), '.binary_cache', os.path.basename(filename))
+
+
+def parse_ascii_values(plyfile, count, chunk_size=1 << 24):
+    """ Parse the next count numbers of an ascii body. The file is read in large chunks cut on line 
+    boundaries and each chunk is parsed at once by numpy.
+    """
+    values = np.empty(count, dtype=np.float64)
+    filled = 0
+    rest = b''
+    while filled < count:
+        chunk = plyfile.read(chunk_size)
+        end_of_file = len(chunk) == 0
+        chunk = rest + chunk
+        if not end_of_file:
+            cut = chunk.rfind(b'\n') + 1
+            chunk, rest = chunk[:cut], chunk[cut:]
+        parsed = np.fromstring(chunk, dtype=np.float64, sep=' ')
+        n = min(parsed.shape[0], count - filled)
+        values[filled:filled + n] = parsed[:n]
+        filled += n
+        if end_of_file:
+            break
+
+    if filled < count:
+        raise ValueError('The ascii body is truncated, {:d} values read instead of {:d}'.format(filled, count))
+    return values
+
+
+def read_ascii_ply(plyfile, filename, triangular_mesh, fields, dtypes, read_faces, ascii_cache):
+    """ Read the body of an ascii ".ply" file (see read_ply). Triangular faces are expected as 
+    "3 v1 v2 v3" lines.
+    """
+    if triangular_mesh:
+        num_points, num_faces, properties = parse_mesh_header(plyfile, '')
+    else:
+        num_points, properties = parse_header(plyfile, '')
+        num_faces = 0
+    if not read_faces:
+        num_faces = 0
+
+    # Vertex rows then face rows
+    n_properties = len(properties)
+    values = parse_ascii_values(plyfile, num_points * n_properties + num_faces * 4)
+    vertex_values = values[:num_points * n_properties].reshape(num_points, n_properties)
+    vertex_data = np.empty(num_points, dtype=properties)
+    for i, (name, _) in enumerate(properties):
+        vertex_data[name] = vertex_values[:, i]
+    faces = values[num_points * n_properties:].reshape(num_faces, 4)[:, 1:].astype(np.int32)
+
+    # A mesh is only cached with its faces, so that the cache can serve any later read
+    if ascii_cache and (read_faces or not triangular_mesh):
+        cache_file = ascii_cache_path(filename)
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        names = [name for name, _ in properties]
+        write_ply(cache_file, [vertex_data[name] for name in names], names,
+                  triangular_faces=faces if triangular_mesh else None)
+
+    if fields is not None:
+        vertex_data = project_fields(vertex_data, fields, dtypes)
+    if triangular_mesh and read_faces:
+        return [vertex_data, faces]
+    return vertex_data
+
+
+def read_ply(filename, triangular_mesh=False, mmap=False, fields=None, dtypes=None, read_faces=True, ascii_cache=False):
     """
     Read ".ply" files
 
@@ -122,6 +237,31 @@ def read_ply(filename, triangular_mesh=False):
     filename : string
         the name of the file to read.
 
+    triangular_mesh : bool
+        read the file as a triangular mesh and return [vertex_data, faces].
+
+    mmap : bool
+        return the vertex data as a copy-on-write np.memmap over the binary body instead of reading 
+        it into memory. Fields are paged in lazily when accessed and the OS page cache is shared 
+        between processes reading the same file (e.g. DataLoader workers).
+
+    fields : list
+        only decode these vertex properties and return them as a list of plain arrays instead of the 
+        structured vertex data (see project_fields). Each entry is a property name or a list of 
+        property names stacked as columns.
+
+    dtypes : list
+        output dtype of each entry of fields (None keeps the stored dtype).
+
+    read_faces : bool
+        with triangular_mesh, set to False to only read the vertex element. The face block is never 
+        decoded and the vertex data is returned alone, as for a point cloud.
+
+    ascii_cache : bool
+        for ascii files, also write a binary copy in a hidden .binary_cache folder next to the file. 
+        Later reads of the ascii file use this copy (and the binary fast path) automatically, as long 
+        as it is newer than the ascii file. Ascii files are parsed in memory, mmap does not apply.
+
     Returns
     -------
     result : array
@@ -148,6 +288,10 @@ def read_ply(filename, triangular_mesh=False):
            [ 0.395  0.394  0.363]
            [ 0.873  0.996  0.092]])
 
+    Read only some properties, straight into the output dtypes
+
+    >>> points, values = read_ply('example.ply', fields=[['x', 'y', 'z'], 'values'], dtypes=[np.float32, None])
+
     """
 
     with open(filename, 'rb') as plyfile:
@@ -160,11 +304,17 @@ def read_ply(filename, triangular_mesh=False):
         # get binary_little/big or ascii
         fmt = plyfile.readline().split()[1].decode()
         if fmt == "ascii":
-            raise ValueError('The file is not binary')
+            cache_file = ascii_cache_path(filename)
+            if os.path.exists(cache_file) and os.path.getmtime(cache_file) >= os.path.getmtime(filename):
+                return read_ply(cache_file, triangular_mesh, mmap, fields, dtypes, read_faces)
+            return read_ascii_ply(plyfile, filename, triangular_mesh, fields, dtypes, read_faces, ascii_cache)
 
         # get extension for building the numpy dtypes
         ext = valid_formats[fmt]
 
+        # Projected reads go through a memory map so that only the requested columns are decoded
+        body_mmap = mmap or fields is not None
+
         # PointCloud reader vs mesh reader
         if triangular_mesh:
 
@@ -172,7 +322,12 @@ def read_ply(filename, triangular_mesh=False):
             num_points, num_faces, properties = parse_mesh_header(plyfile, ext)
 
             # Get point data
-            vertex_data = np.fromfile(plyfile, dtype=properties, count=num_points)
+            vertex_data = read_vertex_body(plyfile, filename, properties, num_points, body_mmap)
+            if fields is not None:
+                vertex_data = project_fields(vertex_data, fields, dtypes)
+
+            if not read_faces:
+                return vertex_data
 
             # Get face data
             face_properties = [('k', ext + 'u1'),
@@ -191,7 +346,9 @@ def read_ply(filename, triangular_mesh=False):
             num_points, properties = parse_header(plyfile, ext)
 
             # Get data
-            data = np.fromfile(plyfile, dtype=properties, count=num_points)
+            data = read_vertex_body(plyfile, filename, properties, num_points, body_mmap)
+            if fields is not None:
+                data = project_fields(data, fields, dtypes)
 
     return data
 
@@ -328,6 +485,115 @@ def write_ply(filename, field_list, field_names, triangular_faces=None):
     return True
 
 
+class PlyStreamWriter:
+    """
+    Write ".ply" files batch by batch, in bounded memory
+
+    The header is written when the writer is opened. When the number of points is not known in advance, 
+    the vertex count is written as a padded placeholder and patched when the writer is closed.
+
+    Parameters
+    ----------
+    filename : string
+        the name of the file to which the data is saved. A '.ply' extension will be appended to the 
+        file name if it does no already have one.
+
+    field_names : list
+        the name of each field as a list of strings.
+
+    dtypes : list
+        the dtype of each field as stored in the file (e.g. np.float32, 'uint8'), same length as 
+        field_names. Batches are cast to these dtypes.
+
+    num_points : int
+        total number of points if known. It is then checked when the writer is closed.
+
+    Examples
+    --------
+    >>> field_names = ['x', 'y', 'z', 'red', 'green', 'blue']
+    >>> dtypes = [np.float32] * 3 + [np.uint8] * 3
+    >>> with PlyStreamWriter('example.ply', field_names, dtypes) as writer:
+    ...     for _ in range(10):
+    ...         points = np.random.rand(1000, 3)
+    ...         colors = np.random.randint(255, size=(1000, 3), dtype=np.uint8)
+    ...         writer.write([points, colors])
+
+    """
+
+    # Width of the back-patched vertex count, enough for any 64 bits count
+    count_width = 20
+
+    def __init__(self, filename, field_names, dtypes, num_points=None):
+        if len(field_names) != len(dtypes):
+            raise ValueError('wrong number of dtypes')
+
+        # Add extension if not there
+        if not filename.endswith('.ply'):
+            filename += '.ply'
+
+        self.filename = filename
+        self.field_names = list(field_names)
+        self.dtype = np.dtype([(name, np.dtype(dtype)) for name, dtype in zip(field_names, dtypes)])
+        self.num_points = num_points
+        self.written = 0
+
+        self.plyfile = open(filename, 'wb')
+
+        header = ['ply', 'format binary_' + sys.byteorder + '_endian 1.0']
+        if num_points is None:
+            count_line = 'element vertex ' + ' ' * self.count_width
+        else:
+            count_line = 'element vertex %d' % num_points
+        header.append(count_line)
+        for name in self.field_names:
+            header.append('property %s %s' % (self.dtype[name].name, name))
+        header.append('end_header')
+
+        # Remember where the count is to patch it when closing
+        self.count_offset = len('\n'.join(header[:2])) + 1 + len('element vertex ')
+        self.plyfile.write(('\n'.join(header) + '\n').encode())
+
+    def write(self, field_list):
+        """ Append a batch of points, given as write_ply field_list (arrays or list of arrays, one column 
+        per field)
+        """
+        field_list = list(field_list) if (type(field_list) == list or type(field_list) == tuple) else list((field_list,))
+        field_list = [field.reshape(-1, 1) if field.ndim < 2 else field for field in field_list]
+        if np.sum([field.shape[1] for field in field_list]) != len(self.field_names):
+            raise ValueError('wrong number of fields')
+        n_points = [field.shape[0] for field in field_list]
+        if not np.all(np.equal(n_points, n_points[0])):
+            raise ValueError('wrong field dimensions')
+
+        data = np.empty(n_points[0], dtype=self.dtype)
+        i = 0
+        for fields in field_list:
+            for field in fields.T:
+                data[self.field_names[i]] = field
+                i += 1
+        data.tofile(self.plyfile)
+        self.written += n_points[0]
+
+    def close(self):
+        if self.plyfile.closed:
+            return
+        if self.num_points is None:
+            self.plyfile.seek(self.count_offset)
+            self.plyfile.write(str(self.written).ljust(self.count_width).encode())
+        self.plyfile.close()
+        if self.num_points is not None and self.written != self.num_points:
+            raise ValueError('{} points written to {}, {} announced'.format(self.written, self.filename, self.num_points))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            # Do not hide the original error behind a count mismatch
+            self.plyfile.close()
+        self.close()
+
+
 def describe_element(name, df):
     """ Takes the columns of the dataframe and builds a ply-like description
 
@@ -0,0 +1,35 @@
+'''
+Manifests of the preprocessing scripts: a JSON file next to the outputs mapping each output to a signature
+of the inputs it was built from, so that re-runs only rebuild what changed.
+'''
+import os
+import json
+import hashlib
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(path, manifest):
+    """Write the manifest atomically, an interrupted run never leaves a truncated file"""
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def file_signature(paths):
+    """Size and modification time of each input file"""
+    return {os.path.basename(p): [os.path.getsize(p), os.path.getmtime(p)] for p in sorted(paths)}
+
+
+def file_digest(paths, chunk_size=1 << 20):
+    """SHA-1 of the contents of the input files, in order"""
+    sha = hashlib.sha1()
+    for p in paths:
+        with open(p, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                sha.update(chunk)
+    return sha.hexdigest()
@@ -0,0 +1,61 @@
+'''
+Parallel preloading of the scenes of a dataset into memory, in dataset order, under a memory budget.
+'''
+import os
+import time
+from os.path import isdir, join
+from concurrent.futures import ThreadPoolExecutor
+from tqdm import tqdm
+
+
+def path_bytes(path):
+    """Size on disk of a file or of the files of a directory (scene stores), 0 when missing"""
+    if isdir(path):
+        return sum(path_bytes(join(path, f)) for f in os.listdir(path))
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+def preload(items, load_fn, sources=None, workers=8, budget=None, desc='Pre Load Datas'):
+    """
+    Load items with a pool of threads, the loaders being mostly file reads and decompression
+
+    Parameters
+    ----------
+    items: what load_fn is called on, one per scene
+    load_fn: function of an item returning the loaded scene
+    sources: list of the files each item is read from, to account bytes. The items themselves by default.
+    workers: number of loading threads
+    budget: bytes of sources that may be preloaded, None for no limit. Scenes are taken in order until the
+        budget is reached, the following ones are left to be loaded on demand.
+
+    Returns
+    -------
+    datas: loaded scenes in the order of items, None for the scenes past the budget
+    """
+    if sources is None:
+        sources = [[item] for item in items]
+    sizes = [sum(path_bytes(path) for path in paths) for paths in sources]
+
+    num_preloaded, total = len(items), 0
+    for i, size in enumerate(sizes):
+        if budget is not None and total + size > budget:
+            num_preloaded = i
+            break
+        total += size
+
+    start = time.time()
+    datas = [None] * len(items)
+    with ThreadPoolExecutor(max_workers=workers) as pool, \
+            tqdm(total=total, unit='B', unit_scale=True, unit_divisor=1024, desc=desc) as bar:
+        # map keeps the order of the items whatever the order the threads finish in
+        for i, data in enumerate(pool.map(load_fn, items[:num_preloaded])):
+            datas[i] = data
+            bar.update(sizes[i])
+    elapsed = max(time.time() - start, 1e-6)
+
+    print('{}: {} scenes, {:.2f} GB in {:.1f}s ({:.1f} MB/s)'.format(
+        desc, num_preloaded, total / 1024**3, elapsed, total / 1024**2 / elapsed))
+    if num_preloaded < len(items):
+        print('{}: {} scenes ({:.2f} GB) past the {:.2f} GB budget are loaded on demand'.format(
+            desc, len(items) - num_preloaded, sum(sizes[num_preloaded:]) / 1024**3, budget / 1024**3))
+    return datas
@@ -0,0 +1,83 @@
+'''
+Batch samplers packing scenes under a budget of voxels instead of a fixed number of scenes, the voxel counts
+of the scenes varying by more than 10x on ScanNet.
+'''
+import numpy as np
+import torch
+from torch.utils.data import Sampler
+from tqdm import tqdm
+from lib.scene_index import SceneIndex
+
+
+class VoxelBudgetBatchSampler(Sampler):
+    """
+    Parameters
+    ----------
+    sizes: voxel count of each scene
+    max_voxels: budget of a batch. A scene larger than the budget makes a batch on its own.
+    bucket_size: pack the scenes by buckets of that many scenes sorted by size, so that the scenes of a batch
+        are of similar sizes. 0 packs the scenes in random order.
+    shuffle: random order of the scenes and of the batches, else in dataset order
+    """
+    def __init__(self, sizes, max_voxels, bucket_size=0, shuffle=True):
+        self.sizes = np.asarray(sizes, dtype=np.int64)
+        self.max_voxels = max_voxels
+        self.bucket_size = bucket_size
+        self.shuffle = shuffle
+        self.batches = None
+
+    def plan(self):
+        """Batches of an epoch"""
+        order = torch.randperm(len(self.sizes)).numpy() if self.shuffle else np.arange(len(self.sizes))
+        if self.bucket_size > 0:
+            buckets = [order[i:i + self.bucket_size] for i in range(0, len(order), self.bucket_size)]
+            order = np.concatenate([bucket[np.argsort(-self.sizes[bucket], kind='stable')] for bucket in buckets])
+
+        batches, batch, total = [], [], 0
+        for index in order.tolist():
+            if batch and total + self.sizes[index] > self.max_voxels:
+                batches.append(batch)
+                batch, total = [], 0
+            batch.append(index)
+            total += self.sizes[index]
+        if batch:
+            batches.append(batch)
+
+        if self.shuffle and self.bucket_size > 0:
+            # the batches of a bucket go from the largest scenes to the smallest
+            batches = [batches[i] for i in torch.randperm(len(batches)).tolist()]
+        return batches
+
+    def __iter__(self):
+        # the plan of __len__ is the one iterated, the number of batches depends on the order of the scenes
+        batches = self.plan() if self.batches is None else self.batches
+        self.batches = None
+        return iter(batches)
+
+    def __len__(self):
+        if self.batches is None:
+            self.batches = self.plan()
+        return len(self.batches)
+
+
+def voxel_counts(dataset, index_path=None):
+    """
+    Voxel count of each scene of a dataset, read from the scene index (lib.scene_index) when it holds all the
+    scenes and the column of dataset.voxel_tag(), else from dataset.voxel_count()
+    """
+    if index_path is not None:
+        scene_index = SceneIndex(index_path)
+        if all(name in scene_index for name in dataset.name):
+            counts = scene_index.get(dataset.voxel_tag(), dataset.name)
+            if counts is not None:
+                return counts
+        print('{} lacks {} of some scenes, counting the voxels'.format(index_path, dataset.voxel_tag()))
+    return np.array([dataset.voxel_count(index) for index in tqdm(range(len(dataset)), desc='Count voxels')], dtype=np.int64)
+
+
+def loader_batching(dataset, args):
+    """DataLoader arguments batching the scenes under args.max_voxels, or by args.batch_size when it is 0"""
+    if args.max_voxels > 0:
+        sizes = voxel_counts(dataset, args.scene_index)
+        return {'batch_sampler': VoxelBudgetBatchSampler(sizes, args.max_voxels, bucket_size=args.bucket_size)}
+    return {'batch_size': args.batch_size, 'shuffle': True}
@@ -0,0 +1,91 @@
+'''
+LRU cache of decoded scene arrays, capped in bytes, so that datasets stop decoding the same PLY and
+superpoint files at every epoch and clustering pass.
+
+Each dataset holds one SceneCache and every DataLoader worker fills its own copy, the budget is per worker.
+The workers, and their caches, only live across epochs with persistent_workers=True.
+'''
+import os
+from collections import OrderedDict
+import numpy as np
+from lib.scene_store import read_scene
+
+
+def array_bytes(value):
+    """Bytes held by an array or a (nested) tuple / list / dict of arrays"""
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (tuple, list)):
+        return sum(array_bytes(v) for v in value)
+    if isinstance(value, dict):
+        return sum(array_bytes(v) for v in value.values())
+    if hasattr(value, 'element_size'): # torch tensors
+        return value.element_size() * value.nelement()
+    return 0
+
+
+def copy_arrays(value):
+    if isinstance(value, np.ndarray):
+        return value.copy()
+    if isinstance(value, tuple):
+        return tuple(copy_arrays(v) for v in value)
+    if isinstance(value, list):
+        return [copy_arrays(v) for v in value]
+    if isinstance(value, dict):
+        return {k: copy_arrays(v) for k, v in value.items()}
+    if hasattr(value, 'clone'):
+        return value.clone()
+    return value
+
+
+class SceneCache:
+    """
+    Parameters
+    ----------
+    budget: bytes of decoded arrays kept, 0 disables the cache
+
+    The hit/miss counters are kept in hits and misses and summarized by repr(), never printed.
+    """
+    def __init__(self, budget=0):
+        self.budget = int(budget)
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, load_fn):
+        """
+        Value of key, loaded by load_fn() on a miss. Callers get their own copy of the arrays and may modify
+        them in place, the cached ones stay untouched.
+        """
+        if self.budget <= 0:
+            return load_fn()
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            value = self.entries[key][0]
+        else:
+            self.misses += 1
+            value = load_fn()
+            size = array_bytes(value)
+            if size <= self.budget:
+                self.entries[key] = (value, size)
+                self.bytes += size
+                while self.bytes > self.budget:
+                    _, (_, evicted_size) = self.entries.popitem(last=False)
+                    self.bytes -= evicted_size
+        return copy_arrays(value)
+
+    def read_scene(self, path, fields=('coords', 'colors', 'labels')):
+        """lib.scene_store.read_scene through the cache"""
+        return self.get(('scene', str(path), tuple(fields)), lambda: read_scene(path, fields))
+
+    def load(self, path):
+        """np.load through the cache"""
+        return self.get(('npy', str(path)), lambda: np.load(path))
+
+    def __repr__(self):
+        lookups = max(self.hits + self.misses, 1)
+        return 'SceneCache(pid {}): {} hits, {} misses ({:.1%} hit rate), {} entries, {:.2f}/{:.2f} GB'.format(
+            os.getpid(), self.hits, self.misses, self.hits / lookups, len(self.entries),
+            self.bytes / 1024**3, self.budget / 1024**3)
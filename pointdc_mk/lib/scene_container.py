@@ -0,0 +1,187 @@
+'''
+Chunked scene container: a single file per scene (scene0000_00.ply -> scene0000_00.scenez) holding the point
+attributes in fixed-size blocks, each attribute of each block compressed on its own with zlib or lzma.
+
+    b'SCNZ' | block 0 attr 0 | block 0 attr 1 | ... | block K attr A | JSON index | uint64 index offset | b'SCNZ'
+
+Points are sorted along a Morton curve before being cut into blocks, so every block covers a compact region
+and the index stores its bounding box. A spatial crop only decompresses the blocks its box touches, and only
+the attributes it asks for. The permutation is kept as the 'index' attribute to restore the original order.
+'''
+import os
+import json
+import zlib
+import lzma
+import numpy as np
+from os.path import exists
+
+CONTAINER_SUFFIX = '.scenez'
+MAGIC = b'SCNZ'
+TRAILER = np.dtype([('offset', '<u8'), ('magic', 'S4')])
+
+CODECS = {'zlib': (lambda b, level: zlib.compress(b, level), zlib.decompress),
+          'lzma': (lambda b, level: lzma.compress(b, preset=level), lzma.decompress)}
+
+
+def container_path(path):
+    """Scene container file of a processed PLY file"""
+    path = str(path)
+    if path.endswith(CONTAINER_SUFFIX):
+        return path
+    if path.endswith('.ply'):
+        path = path[:-4]
+    return path + CONTAINER_SUFFIX
+
+
+def has_container(path):
+    return exists(container_path(path))
+
+
+def morton_order(coords, bits=10):
+    """Permutation sorting points along a Morton (z-order) curve of a 2^bits grid over their bounding box"""
+    bound_min, bound_max = coords.min(0), coords.max(0)
+    grid = (coords - bound_min) / np.maximum(bound_max - bound_min, 1e-8) * (2 ** bits - 1)
+    grid = grid.astype(np.uint64)
+    code = np.zeros(coords.shape[0], dtype=np.uint64)
+    for bit in range(bits):
+        for axis in range(3):
+            code |= ((grid[:, axis] >> np.uint64(bit)) & np.uint64(1)) << np.uint64(3 * bit + axis)
+    return np.argsort(code, kind='stable')
+
+
+def write_container(path, block_size=65536, codec='zlib', level=6, spatial_sort=True, **attributes):
+    """
+    Write a chunked scene container
+
+    Parameters
+    ----------
+    path: PLY file or container file
+    block_size: number of points per block
+    codec: 'zlib' or 'lzma'
+    level: compression level (zlib level or lzma preset)
+    spatial_sort: sort the points along a Morton curve so that blocks are spatially compact. Needs 'coords'.
+    attributes: arrays of the scene, all with the same number of points
+    """
+    compress = CODECS[codec][0]
+    num_points = next(iter(attributes.values())).shape[0]
+    coords = attributes.get('coords', None)
+
+    if spatial_sort and coords is not None:
+        order = morton_order(coords)
+    else:
+        order = np.arange(num_points)
+    attributes = {name: np.ascontiguousarray(array[order]) for name, array in attributes.items()}
+    attributes['index'] = order.astype(np.int32)
+
+    header = {'num_points': num_points, 'block_size': block_size, 'codec': codec, 'attributes': {}, 'blocks': []}
+    for name, array in attributes.items():
+        header['attributes'][name] = {'dtype': array.dtype.str, 'shape': list(array.shape[1:])}
+    if coords is not None:
+        header['bbox'] = [coords.min(0).tolist(), coords.max(0).tolist()]
+        header['mean'] = coords.astype(np.float64).mean(0).tolist()
+
+    path = container_path(path)
+    with open(path + '.tmp', 'wb') as f:
+        f.write(MAGIC)
+        for start in range(0, num_points, block_size):
+            end = min(start + block_size, num_points)
+            block = {'start': start, 'count': end - start, 'offsets': {}}
+            if coords is not None:
+                block_coords = attributes['coords'][start:end]
+                block['bbox'] = [block_coords.min(0).tolist(), block_coords.max(0).tolist()]
+            for name, array in attributes.items():
+                payload = compress(array[start:end].tobytes(), level)
+                block['offsets'][name] = [f.tell(), len(payload)]
+                f.write(payload)
+            header['blocks'].append(block)
+        index_offset = f.tell()
+        f.write(json.dumps(header).encode())
+        np.array([(index_offset, MAGIC)], dtype=TRAILER).tofile(f)
+    os.replace(path + '.tmp', path)
+    return path
+
+
+class SceneContainer:
+    def __init__(self, path):
+        self.path = container_path(path)
+        with open(self.path, 'rb') as f:
+            f.seek(-TRAILER.itemsize, os.SEEK_END)
+            trailer = np.fromfile(f, dtype=TRAILER, count=1)[0]
+            if trailer['magic'] != MAGIC:
+                raise ValueError('{} is not a scene container'.format(self.path))
+            f.seek(int(trailer['offset']))
+            self.header = json.loads(f.read()[:-TRAILER.itemsize].decode())
+        self.decompress = CODECS[self.header['codec']][1]
+
+    def __len__(self):
+        return self.header['num_points']
+
+    def blocks_in_box(self, bound_min, bound_max):
+        """Indices of the blocks whose bounding box intersects [bound_min, bound_max]"""
+        selected = []
+        for i, block in enumerate(self.header['blocks']):
+            block_min, block_max = np.array(block['bbox'][0]), np.array(block['bbox'][1])
+            if np.all(block_min <= bound_max) and np.all(block_max >= bound_min):
+                selected.append(i)
+        return selected
+
+    def read_blocks(self, fields, blocks):
+        """Decode some attributes of some blocks, concatenated in container order"""
+        arrays = {name: [] for name in fields}
+        with open(self.path, 'rb') as f:
+            for i in blocks:
+                block = self.header['blocks'][i]
+                for name in fields:
+                    attribute = self.header['attributes'][name]
+                    offset, length = block['offsets'][name]
+                    f.seek(offset)
+                    array = np.frombuffer(self.decompress(f.read(length)), dtype=attribute['dtype'])
+                    arrays[name].append(array.reshape([block['count']] + attribute['shape']))
+        results = []
+        for name in fields:
+            attribute = self.header['attributes'][name]
+            if len(arrays[name]) == 0:
+                results.append(np.empty([0] + attribute['shape'], dtype=attribute['dtype']))
+            else:
+                results.append(np.concatenate(arrays[name], 0))
+        return results
+
+    def read(self, fields=('coords', 'colors', 'labels'), bbox=None):
+        """
+        Read attributes of the scene
+
+        Parameters
+        ----------
+        fields: attribute names. 'index' gives the position of each point in the original point order.
+        bbox: (bound_min, bound_max) crop box in stored coordinates. Only the blocks touching the box are
+            decompressed and only the points inside it are returned, in container order (ask for 'index' to
+            map them back). Without a box, the whole scene is returned in its original order.
+
+        Returns
+        -------
+        arrays: list[np.ndarray] in the order of fields
+        """
+        fields = list(fields)
+        if bbox is None:
+            arrays = self.read_blocks(fields, range(len(self.header['blocks'])))
+            index = self.read_blocks(['index'], range(len(self.header['blocks'])))[0]
+            results = []
+            for array in arrays:
+                restored = np.empty_like(array)
+                restored[index] = array
+                results.append(restored)
+            return results
+
+        bound_min, bound_max = np.asarray(bbox[0]), np.asarray(bbox[1])
+        blocks = self.blocks_in_box(bound_min, bound_max)
+        arrays = self.read_blocks(fields, blocks)
+        if 'coords' in fields:
+            coords = arrays[fields.index('coords')]
+        else:
+            coords = self.read_blocks(['coords'], blocks)[0]
+        mask = np.all((coords >= bound_min) & (coords <= bound_max), axis=1)
+        return [array[mask] for array in arrays]
+
+
+def read_container(path, fields=('coords', 'colors', 'labels'), bbox=None):
+    return SceneContainer(path).read(fields, bbox)
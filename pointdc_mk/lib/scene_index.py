@@ -0,0 +1,80 @@
+'''
+Scene index: per-scene facts gathered once by data_prepare/build_scene_index.py into one table next to the
+dataset, so that samplers, datasets and benchmarks do not load and voxelize the scenes to learn them.
+
+    scene_index.npz
+        names            scene names (file path relative to the dataset, without extension)
+        points           int64 (S,)      number of points
+        bbox_min         float32 (S, 3)  bounding box in the coordinates of the file
+        bbox_max         float32 (S, 3)
+        superpoints      int64 (S,)      number of superpoints (with --sp_path), -1 without superpoint file
+        voxels_<tag>     int64 (S,)      number of voxels for a voxel size / clip / crop, see voxel_tag
+'''
+import os
+import numpy as np
+
+INDEX_FILE = 'scene_index.npz'
+
+
+def voxel_tag(voxel_size, clip_bound=None, r_crop=None):
+    """Column name of the voxel counts at voxel_size, after S3DIS clipping at clip_bound or KITTI cropping at r_crop"""
+    tag = 'voxels_{:g}'.format(voxel_size)
+    if clip_bound is not None:
+        tag += '_clip{:g}'.format(clip_bound)
+    if r_crop is not None:
+        tag += '_crop{:g}'.format(r_crop)
+    return tag
+
+
+def clip_mask(coords, clip_bound):
+    """Points kept by the clip() of the S3DIS datasets, None when the scene is not clipped"""
+    bound_min, bound_max = coords.min(0).astype(float), coords.max(0).astype(float)
+    bound_size = bound_max - bound_min
+    if bound_size.max() < clip_bound:
+        return None
+    center = bound_min + bound_size * 0.5
+    return np.all((coords >= center - clip_bound) & (coords < center + clip_bound), axis=1)
+
+
+def scene_key(name):
+    return str(name).replace(os.sep, '/').strip('/')
+
+
+def save_scene_index(path, columns):
+    """Write the table atomically, columns being a dict of arrays of the same length as columns['names']"""
+    tmp = path[:-4] + '.{}.tmp.npz'.format(os.getpid())
+    np.savez(tmp, **columns)
+    os.replace(tmp, path)
+
+
+class SceneIndex:
+    def __init__(self, path):
+        with np.load(path) as data:
+            self.columns = {name: data[name] for name in data.files}
+        self.rows = {scene_key(name): row for row, name in enumerate(self.columns['names'])}
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, name):
+        return scene_key(name) in self.rows
+
+    def row(self, names):
+        """Row of a scene, or rows of a list of scenes"""
+        if isinstance(names, str):
+            return self.rows[scene_key(names)]
+        return np.array([self.rows[scene_key(name)] for name in names], dtype=np.int64)
+
+    def get(self, column, names):
+        """Value of a column for a scene or a list of scenes, None when the index has no such column"""
+        if column not in self.columns:
+            return None
+        return self.columns[column][self.row(names)]
+
+    def voxels(self, names, voxel_size, clip_bound=None, r_crop=None):
+        return self.get(voxel_tag(voxel_size, clip_bound, r_crop), names)
+
+    def clipped(self, names, clip_bound):
+        """Whether S3DIS clip() cuts the scenes at clip_bound"""
+        rows = self.row(names)
+        return (self.columns['bbox_max'][rows] - self.columns['bbox_min'][rows]).max(-1) >= clip_bound
@@ -0,0 +1,127 @@
+'''
+Scene store: one directory per scene, next to its processed PLY file (scene0000_00.ply -> scene0000_00.scene/).
+Every attribute is a plain .npy file in a compact dtype, described by a small JSON header written last.
+
+    scene0000_00.scene/
+        header.json      {"num_points": N, "attributes": {"coords": {"dtype": "<f4", "shape": [N, 3]}, ...}}
+        coords.npy       float32 (N, 3)
+        colors.npy       uint8   (N, 3)
+        labels.npy       int16   (N,)
+        superpoint.npy   int32   (N,)     optional
+'''
+import os
+import json
+import numpy as np
+from os.path import join, exists
+from lib.helper_ply import read_ply, project_fields
+from lib.scene_container import has_container, read_container
+
+
+STORE_SUFFIX = '.scene'
+HEADER_FILE = 'header.json'
+
+SCENE_DTYPES = {'coords': np.float32,
+                'colors': np.uint8,
+                'labels': np.int16,
+                'superpoint': np.int32,
+                'remission': np.float32}
+
+PLY_FIELDS = {'coords': ['x', 'y', 'z'],
+              'colors': ['red', 'green', 'blue'],
+              'labels': 'class',
+              'remission': 'remission'}
+
+
+def scene_store_path(path):
+    """Scene store directory of a processed PLY file"""
+    path = str(path)
+    if path.endswith(STORE_SUFFIX):
+        return path
+    if path.endswith('.ply'):
+        path = path[:-4]
+    return path + STORE_SUFFIX
+
+
+def has_scene_store(path):
+    return exists(join(scene_store_path(path), HEADER_FILE))
+
+
+def write_scene(path, **attributes):
+    """
+    Write a scene store
+
+    Parameters
+    ----------
+    path: PLY file or scene store directory
+    attributes: arrays of the scene, cast to SCENE_DTYPES when the name is known (coords, colors, labels,
+        superpoint, remission), stored as given otherwise.
+    """
+    store = scene_store_path(path)
+    os.makedirs(store, exist_ok=True)
+    # An existing header is removed first so that a half written store is never read
+    if exists(join(store, HEADER_FILE)):
+        os.remove(join(store, HEADER_FILE))
+
+    header = {'num_points': None, 'attributes': {}}
+    for name, array in attributes.items():
+        array = np.ascontiguousarray(array, dtype=SCENE_DTYPES.get(name, None))
+        np.save(join(store, name + '.npy'), array)
+        header['num_points'] = array.shape[0]
+        header['attributes'][name] = {'dtype': array.dtype.str, 'shape': list(array.shape)}
+
+    with open(join(store, HEADER_FILE), 'w') as f:
+        json.dump(header, f)
+    return store
+
+
+def read_scene_header(path):
+    with open(join(scene_store_path(path), HEADER_FILE)) as f:
+        return json.load(f)
+
+
+def read_scene(path, fields=('coords', 'colors', 'labels'), mmap=False):
+    """
+    Read scene attributes, from the scene store when it exists, then from the chunked scene container
+    (lib.scene_container) and from the PLY file otherwise
+
+    Parameters
+    ----------
+    path: processed PLY file (or scene store directory)
+    fields: attribute names to return
+    mmap: memory-map the store arrays (read only) instead of loading them
+
+    Returns
+    -------
+    arrays: list[np.ndarray] in the order of fields, with SCENE_DTYPES dtypes on both paths
+    """
+    store = scene_store_path(path)
+    if exists(join(store, HEADER_FILE)):
+        return [np.load(join(store, name + '.npy'), mmap_mode='r' if mmap else None) for name in fields]
+    if has_container(path):
+        return read_container(path, fields)
+
+    return read_ply(str(path), fields=[PLY_FIELDS[name] for name in fields],
+                    dtypes=[SCENE_DTYPES[name] for name in fields])
+
+
+def ply_attributes(path, sp_file=None):
+    """Scene attributes of a processed PLY file (and its superpoint file), in SCENE_DTYPES"""
+    data = read_ply(str(path), mmap=True)
+    names = list(data.dtype.names)
+    attributes = {}
+    for name, fields in PLY_FIELDS.items():
+        fields = [fields] if isinstance(fields, str) else fields
+        if all(field in names for field in fields):
+            attributes[name] = project_fields(data, [PLY_FIELDS[name]], [SCENE_DTYPES[name]])[0]
+            names = [n for n in names if n not in fields]
+    # Keep unknown properties as they are
+    for name in names:
+        attributes[name] = np.array(data[name])
+    if sp_file is not None and exists(sp_file):
+        attributes['superpoint'] = np.load(sp_file).astype(SCENE_DTYPES['superpoint'])
+    return attributes
+
+
+def convert_ply(path, sp_file=None):
+    """Convert a processed PLY file (and its superpoint file) to a scene store"""
+    return write_scene(path, **ply_attributes(path, sp_file))
@@ -0,0 +1,211 @@
+import numpy as np
+
+
+class VoxelIndex:
+    """
+    Hash index of the integer voxel coordinates of a scene
+
+    Every voxel is linearized to an int64 key over the bounding box of the scene and the keys are sorted
+    once, so that any number of voxels can be found back with one searchsorted.
+    """
+    def __init__(self, coords):
+        coords = np.asarray(coords)
+        self.bound_min = np.floor(coords.min(0)).astype(np.int64)
+        self.dims = np.floor(coords.max(0)).astype(np.int64) - self.bound_min + 1
+        keys = self.keys(np.floor(coords).astype(np.int64))
+        self.order = np.argsort(keys, kind='stable')
+        self.sorted_keys = keys[self.order]
+
+    def keys(self, voxels):
+        voxels = voxels - self.bound_min
+        return (voxels[:, 0] * self.dims[1] + voxels[:, 1]) * self.dims[2] + voxels[:, 2]
+
+    def lookup(self, query):
+        """Row of each query voxel in the indexed coords, -1 when it is not there"""
+        query = np.asarray(query).reshape(-1, 3)
+        voxels = np.floor(query)
+        valid = np.all(voxels == query, 1)
+        voxels = voxels.astype(np.int64)
+        valid &= np.all((voxels >= self.bound_min) & (voxels < self.bound_min + self.dims), 1)
+
+        keys = self.keys(voxels)
+        pos = np.searchsorted(self.sorted_keys, keys)
+        pos[pos == self.sorted_keys.shape[0]] = 0
+        valid &= self.sorted_keys[pos] == keys
+        return np.where(valid, self.order[pos], -1)
+
+
+def _group_mode(groups, values):
+    """
+    Most frequent value of each group from a sparse contingency table of (group, value) pairs, ties going to
+    the smallest value like scipy.stats.mode
+
+    Returns
+    -------
+    unique_groups, group_inverse, mode of each group, count of the mode, size of each group
+    """
+    unique_groups, group_inverse = np.unique(groups, return_inverse=True)
+    unique_values, value_inverse = np.unique(values, return_inverse=True)
+    pairs, counts = np.unique(group_inverse.astype(np.int64) * unique_values.shape[0] + value_inverse,
+                              return_counts=True)
+    pair_group, pair_value = pairs // unique_values.shape[0], pairs % unique_values.shape[0]
+    # per group, highest count first then smallest value
+    order = np.lexsort((pair_value, -counts, pair_group))
+    first = order[np.r_[True, pair_group[order][1:] != pair_group[order][:-1]]]
+    group_size = np.bincount(group_inverse, minlength=unique_groups.shape[0])
+    return unique_groups, group_inverse, unique_values[pair_value[first]], counts[first], group_size
+
+
+def merge_superpoints(voxel_idx, region_idx, num_regions=None, majority=0.5):
+    """
+    Merge VCCS supervoxels with region growing: a supervoxel covered by one region for more than the majority
+    ratio of its points takes the id of that region (which may be -1), otherwise it keeps its own id shifted
+    past the region ids
+
+    Parameters
+    ----------
+    voxel_idx: supervoxel id of each point, -1 when unassigned
+    region_idx: region id of each point, -1 when unassigned
+    num_regions: offset of the supervoxel ids, the number of regions by default
+
+    Returns
+    -------
+    merged: superpoint id of each point, -1 when unassigned
+    """
+    if num_regions is None:
+        num_regions = region_idx.max() + 1
+    merged = -np.ones_like(voxel_idx)
+    valid = voxel_idx != -1
+    if not valid.any():
+        return merged
+    voxels, inverse, dominant, dominant_count, voxel_size = _group_mode(voxel_idx[valid], region_idx[valid])
+    voxel_merged = np.where(dominant_count > voxel_size * majority, dominant, voxels + num_regions)
+    merged[valid] = voxel_merged[inverse]
+    return merged
+
+
+def make_labels_continuous(sp_labels):
+    """Renumber superpoint ids to 0..K-1 in increasing order, -1 stays -1"""
+    continuous = -np.ones_like(sp_labels)
+    valid = sp_labels != -1
+    continuous[valid] = np.unique(sp_labels[valid], return_inverse=True)[1].reshape(-1)
+    return continuous
+
+
+def superpoint_majority(sp_labels, labels):
+    """Majority label of the superpoint of each point, -1 for points without superpoint"""
+    sp2gt = -np.ones_like(labels)
+    valid = sp_labels != -1
+    if valid.any():
+        _, inverse, dominant, _, _ = _group_mode(sp_labels[valid], labels[valid])
+        sp2gt[valid] = dominant[inverse]
+    return sp2gt
+
+
+def compact_superpoints(sp_labels):
+    """make_labels_continuous for ids bounded by the number of superpoints, in O(N) with a presence table"""
+    compact = -np.ones_like(sp_labels)
+    valid = sp_labels != -1
+    if valid.any():
+        present = np.bincount(sp_labels[valid]) > 0
+        compact[valid] = (np.cumsum(present) - 1)[sp_labels[valid]]
+    return compact
+
+
+def drop_superpoints(sp_labels, drop_threshold):
+    """Superpoints of fewer than drop_threshold points set to -1, the others renumbered 0..K-1 in order, in one pass"""
+    dropped = -np.ones_like(sp_labels)
+    valid = sp_labels != -1
+    if valid.any():
+        _, inverse, counts = np.unique(sp_labels[valid], return_inverse=True, return_counts=True)
+        kept = counts >= drop_threshold
+        dropped[valid] = np.where(kept, np.cumsum(kept) - 1, -1)[inverse.reshape(-1)]
+    return dropped
+
+
+SIZE_BINS = 24
+
+
+def superpoint_stats(sp_labels, labels, drop_threshold=50, ignore_label=-1):
+    """
+    Quality counts of the superpoints of a scene from one label/superpoint contingency table. Counts of
+    several scenes add up with merge_superpoint_stats and are turned into ratios by format_superpoint_stats.
+
+    Returns
+    -------
+    dict with
+        points, labeled, unassigned: points, points with a label, points without superpoint
+        superpoints: number of superpoints
+        size_histogram: superpoints by size, bin i counting sizes in [2^i, 2^(i+1))
+        in_superpoint: labeled points inside a superpoint
+        majority: labeled points carrying the majority label of their superpoint
+        dropped_superpoints, dropped_points: superpoints with fewer than drop_threshold labeled points, as
+            dropped by the datasets, and the labeled points they hold
+    """
+    sp_labels, labels = np.asarray(sp_labels).reshape(-1), np.asarray(labels).reshape(-1)
+    assigned = sp_labels != -1
+    labeled = (labels != ignore_label) & (labels != -1)
+    valid = assigned & labeled
+
+    sizes = np.bincount(make_labels_continuous(sp_labels[assigned]))
+    stats = {'points': int(sp_labels.shape[0]), 'labeled': int(labeled.sum()), 'unassigned': int((~assigned).sum()),
+             'superpoints': int(sizes.shape[0]), 'in_superpoint': int(valid.sum()), 'majority': 0,
+             'dropped_superpoints': 0, 'dropped_points': 0,
+             'size_histogram': np.bincount(np.minimum(np.log2(np.maximum(sizes, 1)).astype(np.int64), SIZE_BINS - 1),
+                                           minlength=SIZE_BINS).tolist()}
+    if valid.any():
+        _, _, _, majority, labeled_sizes = _group_mode(sp_labels[valid], labels[valid])
+        dropped = labeled_sizes < drop_threshold
+        stats['majority'] = int(majority.sum())
+        stats['dropped_superpoints'], stats['dropped_points'] = int(dropped.sum()), int(labeled_sizes[dropped].sum())
+    return stats
+
+
+def merge_superpoint_stats(stats_list):
+    """Sum superpoint_stats of several scenes"""
+    merged = {}
+    for stats in stats_list:
+        for key, value in stats.items():
+            if key == 'size_histogram':
+                merged[key] = (np.array(merged.get(key, np.zeros(SIZE_BINS, dtype=np.int64))) + value).tolist()
+            else:
+                merged[key] = merged.get(key, 0) + value
+    return merged
+
+
+def format_superpoint_stats(stats):
+    """One line summary of superpoint_stats: purity, ASA, coverage, sizes and what drop_threshold removes"""
+    purity = stats['majority'] / max(stats['in_superpoint'], 1)
+    asa = stats['majority'] / max(stats['labeled'], 1)
+    return ('{} superpoints, purity {:.2%}, ASA {:.2%}, unassigned {:.2%}, mean size {:.1f}, '
+            'dropped {} superpoints ({:.2%} of labeled points)').format(
+        stats['superpoints'], purity, asa, stats['unassigned'] / max(stats['points'], 1),
+        (stats['points'] - stats['unassigned']) / max(stats['superpoints'], 1), stats['dropped_superpoints'],
+        stats['dropped_points'] / max(stats['labeled'], 1))
+
+
+def format_size_histogram(histogram):
+    """Multi-line text histogram of superpoint sizes"""
+    histogram = np.asarray(histogram)
+    nonzero = np.nonzero(histogram)[0]
+    if nonzero.shape[0] == 0:
+        return ''
+    lines = []
+    for i in range(nonzero[0], nonzero[-1] + 1):
+        bar = '#' * int(round(50 * histogram[i] / histogram.max()))
+        lines.append('{:>8} - {:<8} {:>8} {}'.format(2 ** i, 2 ** (i + 1) - 1, histogram[i], bar))
+    return '\n'.join(lines)
+
+
+def superpoint_colormap(repeats=1000):
+    """The Set3/Set1/Set2 palette of the superpoint visualizations, repeated, black last for -1"""
+    import matplotlib.pyplot as plt
+    palette = [plt.cm.Set3(k) for k in range(12)] + [plt.cm.Set1(k) for k in range(9)] + [plt.cm.Set2(k) for k in range(8)]
+    return np.array(palette * repeats + [(0, 0, 0, 0)])
+
+
+def superpoint_colors(sp_labels, colormap):
+    """uint8 RGB of each point from its superpoint id in one lookup, black for -1"""
+    sp_labels = np.asarray(sp_labels).astype(np.int64)
+    sp_labels = np.where(sp_labels == -1, -1, sp_labels % (colormap.shape[0] - 1))
+    return (255 * colormap[sp_labels, :3]).astype(np.uint8)
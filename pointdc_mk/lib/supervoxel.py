@@ -0,0 +1,266 @@
+'''
+Initial superpoints of a voxelized scene: VCCS supervoxels merged with normal-based region growing.
+
+Two backends give the two partitions. 'pcl' runs pclpy SupervoxelClustering and region_growing, 'numpy'
+reimplements them on scipy so that the superpoint scripts run where PCL cannot be installed:
+    - normals by PCA of the radius neighbourhood of every voxel, batched through np.linalg.eigh
+    - supervoxels grown from seed voxels over the 26-adjacency of the voxel grid, one breadth-first ring
+      per round for all supervoxels at once, each voxel taken by the closest supervoxel in the VCCS
+      distance (spatial, colour and normal terms weighted by their importance)
+    - region growing as connected components (union-find) of the k nearest neighbour graph restricted to
+      edges whose normals are within the smoothness angle. With curvature_threshold=1 every PCL point is a
+      seed, which makes PCL region growing the same components up to the order points are visited in.
+Coordinates are integer voxel coordinates, all distances are in voxels.
+'''
+import numpy as np
+from scipy.spatial import cKDTree
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from lib.superpoint_utils import VoxelIndex, merge_superpoints, make_labels_continuous
+
+BACKENDS = ['pcl', 'numpy']
+
+NEIGHBOUR_OFFSETS = np.array([[i, j, k] for i in (-1, 0, 1) for j in (-1, 0, 1) for k in (-1, 0, 1)
+                              if (i, j, k) != (0, 0, 0)], dtype=np.float32)
+
+
+def estimate_normals(coords, radius=3, viewpoint=(0, 0, 0), tree=None):
+    """
+    PCA normal and surface curvature of every point from the points within radius, normals flipped towards
+    the viewpoint like PCL
+
+    Returns
+    -------
+    normals: (N, 3) float32
+    curvature: (N,) float32, smallest eigenvalue over the sum of the eigenvalues
+    """
+    coords = np.asarray(coords, dtype=np.float64)
+    if tree is None:
+        tree = cKDTree(coords)
+    neighbours = tree.query_ball_point(coords, radius, workers=-1)
+    counts = np.array([len(n) for n in neighbours])
+    rows = np.repeat(np.arange(coords.shape[0]), counts)
+    cols = np.concatenate(neighbours).astype(np.int64)
+
+    mean = np.stack([np.bincount(rows, coords[cols, d], coords.shape[0]) for d in range(3)], 1) / counts[:, None]
+    centered = coords[cols] - mean[rows]
+    cov = np.empty((coords.shape[0], 3, 3))
+    for a in range(3):
+        for b in range(a, 3):
+            cov[:, a, b] = cov[:, b, a] = np.bincount(rows, centered[:, a] * centered[:, b], coords.shape[0])
+    cov /= counts[:, None, None]
+
+    eigenvalues, eigenvectors = np.linalg.eigh(cov)
+    normals = eigenvectors[:, :, 0]
+    flip = ((np.asarray(viewpoint) - coords) * normals).sum(1) < 0
+    normals[flip] = -normals[flip]
+    curvature = eigenvalues[:, 0] / np.maximum(eigenvalues.sum(1), 1e-12)
+    return normals.astype(np.float32), curvature.astype(np.float32)
+
+
+def voxel_adjacency(coords):
+    """Directed (voxel, neighbour) pairs of the 26-adjacency of integer voxel coordinates"""
+    index = VoxelIndex(coords)
+    sources, targets = [], []
+    for offset in NEIGHBOUR_OFFSETS:
+        neighbour = index.lookup(coords + offset)
+        found = neighbour != -1
+        sources.append(np.nonzero(found)[0])
+        targets.append(neighbour[found])
+    return np.concatenate(sources), np.concatenate(targets)
+
+
+def select_seeds(coords, seed_resolution, tree):
+    """VCCS seeds: the voxel closest to the centroid of each seed grid cell, dropping seeds in sparse areas"""
+    cells, inverse = np.unique(np.floor(coords / seed_resolution), axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    centroids = np.stack([np.bincount(inverse, coords[:, d], cells.shape[0]) for d in range(3)], 1)
+    centroids /= np.bincount(inverse, minlength=cells.shape[0])[:, None]
+    seeds = np.unique(tree.query(centroids)[1])
+
+    search_radius = 0.5 * seed_resolution
+    min_points = 0.05 * search_radius * search_radius * np.pi
+    density = tree.query_ball_point(coords[seeds], search_radius, return_length=True, workers=-1)
+    return seeds[density >= min_points]
+
+
+def supervoxel_clustering(coords, colors, normals, seed_resolution=10, spatial_importance=0.4,
+                          normal_importance=1, color_importance=0.2, tree=None):
+    """
+    VCCS supervoxels on a voxel grid of resolution 1
+
+    Supervoxels grow one adjacency ring per round for 1.8 * seed_resolution rounds. A voxel reached by several
+    supervoxels goes to the closest one, and can be taken over later by a closer one, and the supervoxel
+    centroids are updated after every round.
+
+    Returns
+    -------
+    voxel_idx: supervoxel id of each voxel, -1 when no supervoxel reached it
+    """
+    coords = np.asarray(coords, dtype=np.float32)
+    colors = np.asarray(colors, dtype=np.float32)
+    num_voxels = coords.shape[0]
+    voxel_idx = -np.ones(num_voxels, dtype=np.int64)
+    if num_voxels == 0:
+        return voxel_idx
+    if tree is None:
+        tree = cKDTree(coords)
+    seeds = select_seeds(coords, seed_resolution, tree)
+    num_sv = seeds.shape[0]
+    if num_sv == 0:
+        return voxel_idx
+    sources, targets = voxel_adjacency(coords)
+    order = np.argsort(sources, kind='stable')
+    sources, targets = sources[order], targets[order]
+    starts = np.searchsorted(sources, np.arange(num_voxels + 1))
+
+    features = np.concatenate([coords, colors, normals], 1)
+    centroids = features[seeds].copy()
+    voxel_idx[seeds] = np.arange(num_sv)
+    distance = np.full(num_voxels, np.inf, dtype=np.float32)
+    distance[seeds] = 0
+    frontier = seeds
+
+    def vccs_distance(voxels, sv):
+        feat, cent = features[voxels], centroids[sv]
+        spatial = np.linalg.norm(feat[:, :3] - cent[:, :3], axis=1) / seed_resolution
+        color = np.linalg.norm(feat[:, 3:6] - cent[:, 3:6], axis=1) / 255
+        normal = 1 - np.abs((feat[:, 6:] * cent[:, 6:]).sum(1))
+        return normal * normal_importance + color * color_importance + spatial * spatial_importance
+
+    for _ in range(1, int(1.8 * seed_resolution)):
+        if frontier.shape[0] == 0:
+            break
+        # every adjacency edge leaving the frontier, proposing the supervoxel of the frontier voxel
+        counts = starts[frontier + 1] - starts[frontier]
+        edge = np.repeat(starts[frontier] - np.cumsum(np.r_[0, counts[:-1]]), counts) + np.arange(counts.sum())
+        candidate, sv = targets[edge], voxel_idx[sources[edge]]
+        keep = voxel_idx[candidate] != sv
+        candidate, sv = candidate[keep], sv[keep]
+        dist = vccs_distance(candidate, sv)
+        keep = dist < distance[candidate]
+        candidate, sv, dist = candidate[keep], sv[keep], dist[keep]
+        if candidate.shape[0] == 0:
+            break
+
+        # closest proposal per voxel
+        order = np.lexsort((dist, candidate))
+        first = order[np.r_[True, candidate[order][1:] != candidate[order][:-1]]]
+        frontier = candidate[first]
+        voxel_idx[frontier], distance[frontier] = sv[first], dist[first]
+
+        owned = voxel_idx != -1
+        sizes = np.bincount(voxel_idx[owned], minlength=num_sv)
+        sums = np.stack([np.bincount(voxel_idx[owned], features[owned, d], num_sv) for d in range(features.shape[1])], 1)
+        alive = sizes > 0
+        centroids[alive] = sums[alive] / sizes[alive, None]
+        norms = np.linalg.norm(centroids[:, 6:], axis=1, keepdims=True)
+        centroids[:, 6:] /= np.maximum(norms, 1e-12)
+
+    return make_labels_continuous(voxel_idx)
+
+
+def region_growing(coords, normals, n_neighbours=15, smooth_threshold=3, min_size=1, max_size=100000, tree=None):
+    """
+    Normal-based region growing as connected components of the k nearest neighbour graph
+
+    Parameters
+    ----------
+    smooth_threshold: largest angle in degrees between the normals of two neighbours of the same region
+    min_size, max_size: regions outside these sizes are dropped, like in PCL
+
+    Returns
+    -------
+    region_idx: region id of each point, -1 for dropped regions
+    num_regions: number of regions
+    """
+    num_points = coords.shape[0]
+    region_idx = -np.ones(num_points, dtype=np.int64)
+    if num_points == 0:
+        return region_idx, 0
+    if tree is None:
+        tree = cKDTree(coords)
+    k = min(n_neighbours, num_points)
+    neighbours = tree.query(coords, k, workers=-1)[1].reshape(num_points, k)
+    sources = np.repeat(np.arange(num_points), k)
+    targets = neighbours.reshape(-1)
+    smooth = np.abs((normals[sources] * normals[targets]).sum(1)) >= np.cos(np.deg2rad(smooth_threshold))
+    graph = coo_matrix((np.ones(smooth.sum(), dtype=np.int8), (sources[smooth], targets[smooth])),
+                       shape=(num_points, num_points))
+    components = connected_components(graph, directed=False)[1]
+
+    sizes = np.bincount(components)
+    kept = (sizes >= min_size) & (sizes <= max_size)
+    valid = kept[components]
+    region_idx[valid] = make_labels_continuous(components[valid])
+    return region_idx, int(kept.sum())
+
+
+def pcl_supervoxel_clustering(coords, colors, num_threads=2):
+    """VCCS supervoxels from pclpy, as the supervoxel id of each voxel"""
+    from pclpy import pcl
+    pc = pcl.PointCloud.PointXYZRGBA(coords, colors)
+    normals = pc.compute_normals(radius=3, num_threads=num_threads)
+    vox = pcl.segmentation.SupervoxelClustering.PointXYZRGBA(voxel_resolution=1, seed_resolution=10)
+    vox.setInputCloud(pc)
+    vox.setNormalCloud(normals)
+    vox.setSpatialImportance(0.4)
+    vox.setNormalImportance(1)
+    vox.setColorImportance(0.2)
+    output = pcl.vectors.map_uint32t_PointXYZRGBA()
+    vox.extract(output)
+    out = list(output.items())
+
+    voxel_idx = -np.ones(coords.shape[0], dtype=np.int64)
+    if len(out) > 0:
+        # Resolve the members of all supervoxels at once through a hash index of the scene voxels
+        voxel_xyz = [out[voxel][1].voxels_.xyz for voxel in range(len(out))]
+        voxel_num = np.repeat(np.arange(len(out)), [xyz.shape[0] for xyz in voxel_xyz])
+        index_colum = VoxelIndex(coords).lookup(np.concatenate(voxel_xyz, 0))
+        voxel_idx[index_colum[index_colum != -1]] = voxel_num[index_colum != -1]
+    return voxel_idx
+
+
+def pcl_region_growing(coords, num_threads=2):
+    """pclpy region growing, as the region id of each voxel and the number of regions"""
+    from pclpy import pcl
+    import pclpy
+    pc = pcl.PointCloud.PointXYZ(coords)
+    normals = pc.compute_normals(radius=3, num_threads=num_threads)
+    clusters = pclpy.region_growing(pc, normals=normals, min_size=1, max_size=100000, n_neighbours=15,
+                                    smooth_threshold=3, curvature_threshold=1, residual_threshold=1)
+    region_idx = -np.ones(coords.shape[0], dtype=np.int64)
+    if len(clusters) > 0:
+        cluster_indices = [np.asarray(cluster.indices) for cluster in clusters]
+        region_idx[np.concatenate(cluster_indices)] = np.repeat(np.arange(len(clusters)), [c.shape[0] for c in cluster_indices])
+    return region_idx, len(clusters)
+
+
+def initial_superpoints(coords, colors, backend='pcl', num_threads=2, return_parts=False):
+    """
+    Superpoint id of each voxel of a voxelized scene, continuous from 0, -1 for voxels left out
+
+    Parameters
+    ----------
+    coords: (N, 3) float32 integer voxel coordinates, unique
+    colors: (N, 3) uint8 colors
+    backend: 'pcl' or 'numpy'
+    num_threads: threads of PCL normal estimation
+    return_parts: also return the supervoxel and region ids the superpoints were merged from
+    """
+    coords = np.ascontiguousarray(coords, dtype=np.float32)
+    if backend == 'pcl':
+        voxel_idx = pcl_supervoxel_clustering(coords, colors, num_threads)
+        region_idx, num_regions = pcl_region_growing(coords, num_threads)
+    elif backend == 'numpy':
+        tree = cKDTree(coords)
+        normals = estimate_normals(coords, radius=3, tree=tree)[0]
+        voxel_idx = supervoxel_clustering(coords, colors, normals, tree=tree)
+        region_idx, num_regions = region_growing(coords, normals, tree=tree)
+    else:
+        raise ValueError('unknown superpoint backend {}, expected one of {}'.format(backend, BACKENDS))
+
+    sp_labels = make_labels_continuous(merge_superpoints(voxel_idx, region_idx, num_regions=num_regions))
+    if return_parts:
+        return sp_labels, voxel_idx, region_idx
+    return sp_labels
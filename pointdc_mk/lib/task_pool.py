@@ -0,0 +1,80 @@
+'''
+Process pool for long per-scene preprocessing tasks. Unlike concurrent.futures, every attempt runs in its own
+process, so a task stuck in native code (PCL, MinkowskiEngine) can be killed on timeout and retried without
+taking the pool down with it.
+'''
+import time
+import traceback
+import multiprocessing as mp
+from collections import deque
+from multiprocessing.connection import wait
+
+
+def _run_task(fn, task, conn):
+    try:
+        conn.send((True, fn(task)))
+    except Exception:
+        conn.send((False, traceback.format_exc()))
+    finally:
+        conn.close()
+
+
+def run_tasks(fn, tasks, workers=1, timeout=None, retries=0, poll=0.5):
+    """
+    Run fn(task) for every task, at most workers at once, starting them in the given order
+
+    Parameters
+    ----------
+    fn: picklable function of one task
+    tasks: iterable of tasks
+    workers: number of concurrent processes
+    timeout: seconds after which an attempt is killed, None to wait forever
+    retries: how many times a failed, crashed or timed out task is attempted again
+
+    Yields
+    ------
+    (task, result, elapsed seconds of the last attempt, attempts, error) as tasks finish. error is None on
+    success, otherwise the traceback or reason of the last failure and result is None.
+    """
+    pending = deque((task, 0) for task in tasks)
+    running = {}
+    try:
+        while pending or running:
+            while pending and len(running) < workers:
+                task, attempt = pending.popleft()
+                recv_conn, send_conn = mp.Pipe(duplex=False)
+                process = mp.Process(target=_run_task, args=(fn, task, send_conn), daemon=True)
+                process.start()
+                send_conn.close()
+                running[recv_conn] = (task, attempt, process, time.time())
+
+            ready = wait(list(running), timeout=poll)
+            now = time.time()
+            for conn in list(running):
+                task, attempt, process, start = running[conn]
+                if conn in ready:
+                    try:
+                        success, result = conn.recv()
+                    except EOFError:
+                        process.join()
+                        success, result = False, 'worker exited with code {}'.format(process.exitcode)
+                elif timeout is not None and now - start > timeout:
+                    process.kill()
+                    success, result = False, 'timed out after {:.0f}s'.format(timeout)
+                else:
+                    continue
+                process.join()
+                conn.close()
+                del running[conn]
+
+                if success:
+                    yield task, result, now - start, attempt + 1, None
+                elif attempt < retries:
+                    pending.appendleft((task, attempt + 1))
+                else:
+                    yield task, None, now - start, attempt + 1, result
+    finally:
+        for conn, (_, _, process, _) in running.items():
+            process.kill()
+            process.join()
+            conn.close()
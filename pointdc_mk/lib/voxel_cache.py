@@ -0,0 +1,72 @@
+'''
+Cache of the voxelization of the scenes. The quantization happens before any augmentation, so the voxel
+coordinates, unique_map and inverse_map of a scene only depend on the scene file, the voxel size and the
+clipping, and are kept in memory (in the SceneCache of the dataset) and on disk as npz files:
+
+    voxel_cache/
+        <sha1 of scene path, voxel size, clip bound...>.npz     coords, unique_map, inverse_map[, labels, clip_inds]
+'''
+import os
+import hashlib
+import zipfile
+import numpy as np
+from os.path import join, exists
+import MinkowskiEngine as ME
+
+
+def quantize(coords, voxel_size, labels=None):
+    """Floor at voxel_size and hash quantization, the arrays the datasets index their points with"""
+    scale = 1 / voxel_size
+    coords = np.floor(coords * scale)
+    if labels is None:
+        coords, unique_map, inverse_map = ME.utils.sparse_quantize(np.ascontiguousarray(coords), return_index=True, return_inverse=True)
+        voxels = {}
+    else:
+        coords, labels, unique_map, inverse_map = ME.utils.sparse_quantize(np.ascontiguousarray(coords), labels=labels, ignore_label=-1, return_index=True, return_inverse=True)
+        voxels = {'labels': np.asarray(labels)}
+    voxels.update(coords=coords.numpy(), unique_map=np.asarray(unique_map), inverse_map=inverse_map.numpy())
+    return voxels
+
+
+class VoxelCache:
+    """
+    Parameters
+    ----------
+    path: directory of the npz files, None keeps the voxelizations in memory only
+    memory: SceneCache holding the voxelizations in memory, under its byte budget
+    """
+    def __init__(self, path=None, memory=None):
+        self.path = path
+        self.memory = memory
+        if self.path is not None:
+            os.makedirs(self.path, exist_ok=True)
+
+    def get(self, scene_file, params, quantize_fn):
+        """
+        Voxelization of scene_file with params (voxel size, clip bound...), computed by quantize_fn() on a miss.
+        scene_file None bypasses the cache, for scenes that are not read as is from a file.
+        """
+        if scene_file is None:
+            return quantize_fn()
+        # the modification time invalidates the voxelizations of rewritten scenes
+        key = (str(scene_file), os.path.getmtime(scene_file) if exists(scene_file) else None) + tuple(params)
+        if self.memory is None:
+            return self.load(key, quantize_fn)
+        return self.memory.get(('voxels',) + key, lambda: self.load(key, quantize_fn))
+
+    def load(self, key, quantize_fn):
+        if self.path is None:
+            return quantize_fn()
+        file = join(self.path, hashlib.sha1(repr(key).encode()).hexdigest() + '.npz')
+        if exists(file):
+            try:
+                with np.load(file) as data:
+                    return {name: data[name] for name in data.files}
+            except (OSError, ValueError, EOFError, zipfile.BadZipFile):
+                pass # left truncated by an interrupted writer, computed again
+        voxels = quantize_fn()
+        # written under a name of its own then renamed, the workers may fill the same entry concurrently
+        tmp = file[:-4] + '.{}.tmp.npz'.format(os.getpid())
+        np.savez(tmp, **voxels)
+        os.replace(tmp, file)
+        return voxels
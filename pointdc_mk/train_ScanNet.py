@@ -5,6 +5,7 @@ from datasets.ScanNet import Scannettrain, Scannetdistill, Scannetval, cfl_colla
 import MinkowskiEngine as ME
 import torch.nn.functional as F
 from torch.utils.data import DataLoader
+from lib.samplers import loader_batching
 from models.fpn import Res16FPN18
 from models.pretrain_models import SubModel, SegHead
 from eval_ScanNet import eval, eval_once, eval_by_cluster
@@ -21,6 +22,8 @@ def parse_args():
     parser.add_argument('--data_path', type=str, default='data/ScanNet/train', help='pont cloud data path') # 点云文件路径
     parser.add_argument('--feats_path', type=str, default='data/ScanNet/train_feats', help='pont cloud data path') # 特征体文件路径 
     parser.add_argument('--sp_path', type=str, default= 'data/ScanNet/initial_superpoints', help='initial sp path') # 超体素文件路径
+    parser.add_argument('--preload', type=str, default='memory', choices=['memory', 'arena'], help='memory: python lists, arena: memory-mapped arena shared by the workers')
+    parser.add_argument('--arena_path', type=str, default='data/ScanNet/train_arena', help='arena of the distill scenes, built on first use')
     parser.add_argument('--expname', type=str, default= 'default', help='expname for logger')
     ###
     parser.add_argument('--save_path', type=str, default='ckpt/ScanNet/', help='model savepath')
@@ -34,11 +37,20 @@ def parse_args():
     parser.add_argument('--dampening', type=float, default=0.1, help='SGD parameters')
     parser.add_argument('--weight-decay', type=float, default=1e-4, help='SGD parameters')
     parser.add_argument('--workers', type=int, default=8, help='how many workers for loading data')
+    parser.add_argument('--cache_budget', type=float, default=0, help='GB of decoded scenes cached by each loading worker, 0 disables the cache')
+    parser.add_argument('--voxel_cache_path', type=str, default=None, help='directory the voxelizations of the scenes are cached in, None keeps them in memory only')
+    parser.add_argument('--preload_workers', type=int, default=8, help='how many threads preload the scenes')
+    parser.add_argument('--preload_budget', type=float, default=None, help='GB of scene files preloaded, the rest is loaded on demand')
     parser.add_argument('--cluster_workers', type=int, default=4, help='how many workers for loading data in clustering')
     parser.add_argument('--seed', type=int, default=2023, help='random seed')
     parser.add_argument('--log-interval', type=int, default=150, help='log interval')
     parser.add_argument('--batch_size', type=int, default=8, help='batchsize in training')
+    parser.add_argument('--max_voxels', type=int, default=0, help='batches packed up to that many voxels instead of batch_size scenes, 0 disables')
+    parser.add_argument('--bucket_size', type=int, default=0, help='with max_voxels, scenes packed by buckets of that many scenes of similar sizes')
+    parser.add_argument('--scene_index', type=str, default=None, help='scene index of data_prepare/build_scene_index.py, the voxel counts of max_voxels are read from it')
     parser.add_argument('--voxel_size', type=float, default=0.02, help='voxel size in SparseConv')
+    parser.add_argument('--elastic', type=str, default='off', choices=['off', 'exact', 'fast'], help='elastic distortion of the training scenes, fast blurs and interpolates the noise with 1-D filters')
+    parser.add_argument('--elastic_pool', type=int, default=0, help='blurred noise fields reused by fast elastic distortion, 0 draws new ones for every scene')
     parser.add_argument('--input_dim', type=int, default=6, help='network input dimension')### 6 for XYZGB
     parser.add_argument('--primitive_num', type=int, default=20, help='how many primitives used in training')
     parser.add_argument('--semantic_class', type=int, default=20, help='ground truth semantic class')
@@ -61,8 +73,9 @@ def main(args, logger):
                                 lr=args.lrs[0])
     ## Prepare Data
     distillset = Scannetdistill(args)
-    distill_loader = DataLoader(distillset, batch_size=args.batch_size, shuffle=True, collate_fn=cfl_collate_fn_distill(), \
-                                num_workers=args.workers, pin_memory=True, worker_init_fn=worker_init_fn(seed))
+    distill_loader = DataLoader(distillset, **loader_batching(distillset, args), collate_fn=cfl_collate_fn_distill(), \
+                                num_workers=args.workers, pin_memory=True, worker_init_fn=worker_init_fn(seed), \
+                                persistent_workers=args.workers > 0 and args.cache_budget > 0)
     ## Distill
     for epoch in range(1, args.max_epoch[0]+1):
         distill(distill_loader, logger, model, submodel, adam, distill_loss, epoch, args.max_epoch[0])
@@ -72,8 +85,10 @@ def main(args, logger):
 
     ## Cluster & Compute pseudo labels
     trainset = Scannettrain(args)
+    # cluster_loader and train_loader share trainset, each one keeps its own mode in its persistent workers
     cluster_loader = DataLoader(trainset, batch_size=1, shuffle=True, collate_fn=cfl_collate_fn(), \
-                                num_workers=args.workers, pin_memory=True, worker_init_fn=worker_init_fn(seed))
+                                num_workers=args.workers, pin_memory=True, worker_init_fn=worker_init_fn(seed), \
+                                persistent_workers=args.workers > 0 and args.cache_budget > 0)
     model, submodel = model.cuda(), submodel.cuda()
     centroids_norm = init_cluster(args, logger, cluster_loader, model, submodel=submodel)
 
@@ -83,8 +98,9 @@ def main(args, logger):
     # Super Voxel Clustering
     logger.info('**************Start Super Voxel Clustering**************')
     ## Prepare Data
-    train_loader = DataLoader(trainset, batch_size=args.batch_size, shuffle=True, collate_fn=cfl_collate_fn(), \
-                               num_workers=args.workers, pin_memory=True, worker_init_fn=worker_init_fn(seed))
+    train_loader = DataLoader(trainset, **loader_batching(trainset, args), collate_fn=cfl_collate_fn(), \
+                               num_workers=args.workers, pin_memory=True, worker_init_fn=worker_init_fn(seed), \
+                               persistent_workers=args.workers > 0 and args.cache_budget > 0)
     ## Warm Up
     model.mode = 'train'
     ### Prepare Model/Loss/Optimizer